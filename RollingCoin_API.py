@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Library interface of RollingCoin_V1 and RollingCoin_V2: depth model arrays in, arrays out.
+# Nothing is read, written or printed, errors raise exceptions instead of exiting.
+#
+# Example:
+#   import RollingCoin_API
+#   limits, valdcos = RollingCoin_API.contour_limits(depth_array, -9999.0, [3, 6, 10], coin_radius = 10)
+#   surface = RollingCoin_API.surface(depth_array, -9999.0, radius = 5, trim = True)
+
+# Depends on:
+# 1. NumPy (see http://www.numpy.org/)
+# 2. RollingCoin_V1.py and RollingCoin_V2.py (GDAL is imported by them)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import numpy
+import RollingCoin_V1
+import RollingCoin_V2
+
+
+# NoData value of contour limit arrays ("Deep enough", as in RollingCoin_V1.main):
+limits_nodata = 15000
+
+# FTA production contours (default contour list of RollingCoin_V1.main):
+production_contours = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500]
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the (minimum, maximum) depth of an array without NoData and NaN cells, or None if the array has no data.
+#
+def depth_range(data_array, nodata):
+    valid = numpy.isfinite(data_array)
+    if(nodata is not None):
+        valid &= data_array != nodata
+    if(numpy.any(valid) == False):
+        return None
+    return float(data_array[valid].min()), float(data_array[valid].max())
+
+
+#
+# Returns the shared coin of RollingCoin_V1 (version = 1, always trimmed) or RollingCoin_V2 (version = 2).
+#
+def coin(version, radius, trim = True):
+    if(version == 1):
+        return RollingCoin_V1.cached_coin(radius)
+    return RollingCoin_V2.cached_coin(radius, trim)
+
+
+#
+# RollingCoin_V1 contour limits of a depth model array, parameters as in RollingCoin_V1.main (edt_radius in units of cell_size).
+# Returns the contour limit array (NoData = limits_nodata) and the list of rolled contour values.
+#
+def contour_limits(data_array, nodata, contour_list = None, coin_radius = 10, engine = "numpy", edt_radius = None, cell_size = 1.0,
+                   block_size = 256, level_workers = None):
+    if(contour_list is None):
+        contour_list = production_contours
+
+    min_max_depth = depth_range(data_array, nodata)
+    if(min_max_depth is None):
+        return numpy.full(data_array.shape, limits_nodata, dtype = numpy.int16), []
+    levels = RollingCoin_V1.contour_levels(contour_list, min_max_depth)
+
+    roll_radius = RollingCoin_V1.coin_roll_radius(engine, coin_radius, edt_radius, (0.0, cell_size, 0.0, 0.0, 0.0, -cell_size))
+    dest_array = RollingCoin_V1.roll_contour_limits(data_array, nodata, limits_nodata, coin(1, coin_radius), roll_radius, levels, engine,
+                                                    block_size, level_workers)
+    if(dest_array is None):
+        raise Exception("Error in Coin Rolling.")
+    return dest_array, [valdco for valdco, deplim in levels]
+
+
+#
+# RollingCoin_V2 surface of a depth model array, parameters as in RollingCoin_V2.main. data_array is not modified.
+#
+def surface(data_array, nodata, radius = 5, trim = True, engine = "numpy", block_size = 256, contour_depths = None):
+    classes = None
+    if(contour_depths is not None):
+        min_max_depth = depth_range(data_array, nodata)
+        classes = RollingCoin_V2.contour_classes(contour_depths, None if min_max_depth is None else min_max_depth[1], nodata)
+    return RollingCoin_V2.roll_surface(numpy.array(data_array), nodata, coin(2, radius, trim), radius - 1, engine, block_size, classes = classes)
+
+
+#
+# RollingCoin_V2 surfaces for several coin radii (see RollingCoin_V2.main_radii), in the order of radii.
+#
+def surfaces(data_array, nodata, radii, trim = True, engine = "numpy", block_size = 256):
+    dest_array = RollingCoin_V2.roll_surfaces(numpy.array(data_array), nodata, [coin(2, radius, trim) for radius in radii],
+                                              [radius - 1 for radius in radii], engine, block_size)
+    return [numpy.ascontiguousarray(dest_array[:, :, number]) for number in range(len(radii))]
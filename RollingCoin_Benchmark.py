@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Benchmark harness for RollingCoin_V1 and RollingCoin_V2: times the engines on synthetic depth models
+# (one process per case) and writes the results to JSON. Equivalence with the reference loops is checked by
+# tests/test_equivalence.py.
+#
+# Usage example:
+#   python RollingCoin_Benchmark.py --sizes 500 2000 10000 --radii 5 10 20 --output benchmark.json
+
+# Depends on:
+# 1. GDAL (see http://www.gdal.org/)
+# 2. NumPy (see http://www.numpy.org/)
+# 3. RollingCoin_V1.py, RollingCoin_V2.py and RollingCoin_Report.py
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+try:
+    import os
+    import sys
+    import json
+    import time
+    import shutil
+    import argparse
+    import tempfile
+    import multiprocessing
+    import numpy
+    from osgeo import gdal
+    import RollingCoin_V1
+    import RollingCoin_V2
+    import RollingCoin_Report
+
+except Exception:
+    print "Dependencies not installed? Make sure GDAL and NumPy are installed. Exiting."
+    exit()
+
+
+# # # # # # # # # # # # # # #
+#   Benchmark settings:     #
+# # # # # # # # # # # # # # #
+
+nodata_value = -9999.0
+benchmark_valdco = 10       # V1 stages are timed for the 10 m contour
+main_contour_list = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500] # Default contour_list of V1 main
+
+# Engines available for each (version, stage):
+engines = {
+    ("V1", "buffer_shoals"): ["numpy", "loop"],
+    ("V1", "roll_coin"): ["numpy", "band", "index", "edt", "loop"],
+    ("V1", "main"): ["numpy", "multilevel", "band", "packed", "edt", "index", "loop"],
+    ("V2", "buffer_shoals"): ["numpy", "loop"],
+    ("V2", "roll_coin"): ["numpy", "loop"],
+    ("V2", "main"): ["numpy", "loop"],
+}
+
+# Engines that run cell-by-cell in Python (skipped on large models):
+slow_engines = ["loop", "index"]
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns a smooth random surface (values 0 .. 1) interpolated from a random grid of cell_size cells.
+#
+def smooth_noise(rows, columns, cell_size, random):
+    coarse = random.rand(rows // cell_size + 2, columns // cell_size + 2).astype(numpy.float32)
+
+    y = numpy.arange(rows, dtype = numpy.float32) / cell_size
+    x = numpy.arange(columns, dtype = numpy.float32) / cell_size
+    y0 = y.astype(numpy.int64)
+    x0 = x.astype(numpy.int64)
+    fy = (y - y0).reshape(rows, 1)
+    fx = (x - x0).reshape(1, columns)
+
+    # Interpolate rows, then columns:
+    rows_interpolated = coarse[y0] * (1 - fy) + coarse[y0 + 1] * fy
+    return rows_interpolated[:, x0] * (1 - fx) + rows_interpolated[:, x0 + 1] * fx
+
+
+#
+# Creates a reproducible synthetic depth model: basins, shoals, dredged channels and NoData areas (float32).
+#
+def synthetic_depth_model(rows, columns, seed = 0, nodata = nodata_value):
+    random = numpy.random.RandomState(seed)
+
+    # Basins and shoals:
+    depth = numpy.full((rows, columns), -25.0, dtype = numpy.float32)
+    for cell_size, amplitude in ((256, 40.0), (64, 10.0), (16, 3.0), (4, 0.5)):
+        depth += amplitude * (smooth_noise(rows, columns, cell_size, random) - 0.5)
+
+    # Dredged channels (sinusoidal, 12 m deep, 6 cells wide):
+    column_index = numpy.arange(columns)
+    for channel in range(max(1, rows // 1000)):
+        center = random.rand() * rows
+        amplitude = random.rand() * rows / 8
+        period = (0.5 + random.rand()) * columns
+        path = center + amplitude * numpy.sin(2 * numpy.pi * column_index / period)
+        for row_offset in range(-3, 3):
+            path_rows = (path + row_offset).astype(numpy.int64)
+            inside = (path_rows >= 0) & (path_rows < rows)
+            channel_cells = (path_rows[inside], column_index[inside])
+            depth[channel_cells] = numpy.minimum(depth[channel_cells], -12.0)
+
+    # Land (above sea level) and unsurveyed rectangles are NoData:
+    depth[depth > 0] = nodata
+    for area in range(max(1, (rows * columns) // 2000000)):
+        height = int(rows * (0.05 + 0.15 * random.rand()))
+        width = int(columns * (0.05 + 0.15 * random.rand()))
+        top = random.randint(0, rows - height + 1)
+        left = random.randint(0, columns - width + 1)
+        depth[top : top + height, left : left + width] = nodata
+
+    return depth
+
+
+#
+# Writes a depth model array to a GeoTIFF (5 m cells, ETRS-TM35FIN).
+#
+def write_depth_model(path, depth_array, nodata):
+    driver = gdal.GetDriverByName("GTiff")
+    outdata = driver.Create(path, depth_array.shape[1], depth_array.shape[0], 1, gdal.GDT_Float32)
+    outdata.SetGeoTransform((300000.0, 5.0, 0.0, 7000000.0, 0.0, -5.0))
+    outdata.SetProjection('PROJCS["ETRS89 / TM35FIN(E,N)",AUTHORITY["EPSG","3067"]]')
+    outband = outdata.GetRasterBand(1)
+    outband.SetNoDataValue(nodata)
+    outband.WriteArray(depth_array)
+    outdata = None # Close dataset
+
+
+#
+# Runs one benchmark stage on a depth model array. Returns (elapsed seconds of the stage only, result array).
+#
+def run_stage(version, stage, engine, depth_array, radius, trim, workdir):
+    nodata = nodata_value
+
+    if(version == "V1"):
+        nodata_new = 15000
+        deplim = RollingCoin_V1.parseDepthLimit(benchmark_valdco)
+        coin = RollingCoin_V1.create_coin(radius)
+
+        if(stage == "buffer_shoals"):
+            byte_array = RollingCoin_V1.array_to_binaryarray_numpy(depth_array, deplim, nodata, nodata_new)
+            start = time.time()
+            if(engine == "loop"):
+                result = RollingCoin_V1.buffer_shoals(byte_array, nodata_new)
+            else:
+                result = RollingCoin_V1.buffer_shoals_numpy(byte_array, nodata_new)
+            return time.time() - start, result
+
+        if(stage == "roll_coin"):
+            byte_array = RollingCoin_V1.array_to_binaryarray_numpy(depth_array, deplim, nodata, nodata_new)
+            buffered_array = RollingCoin_V1.buffer_shoals_numpy(byte_array, nodata_new)
+            result = numpy.zeros((depth_array.shape[0], depth_array.shape[1]), dtype = numpy.int16)
+            start = time.time()
+            if(engine == "edt"):
+                RollingCoin_V1.roll_coin_edt(buffered_array, result, float(radius), nodata_new, benchmark_valdco)
+            elif(engine == "index"):
+                RollingCoin_V1.roll_coin_index(buffered_array, result, coin, radius - 1, nodata_new, benchmark_valdco)
+            elif(engine == "band"):
+                RollingCoin_V1.roll_coin_band(buffered_array, result, coin, radius - 1, nodata_new, benchmark_valdco)
+            elif(engine == "loop"):
+                RollingCoin_V1.roll_coin(buffered_array, result, coin, radius - 1, nodata_new, benchmark_valdco)
+            else:
+                RollingCoin_V1.roll_coin_numpy(buffered_array, result, coin, radius - 1, nodata_new, benchmark_valdco)
+            return time.time() - start, result
+
+        if(stage == "main"):
+            inpath = os.path.join(workdir, "depth_model.tif")
+            outpath = os.path.join(workdir, "contour_limits.tif")
+            write_depth_model(inpath, depth_array, nodata)
+            start = time.time()
+            RollingCoin_V1.main(inpath, outpath, os.path.join(workdir, "contours.shp"), engine, coin_radius = radius)
+            return time.time() - start, None
+
+    if(version == "V2"):
+        coin = RollingCoin_V2.create_coin(radius, trim)
+
+        if(stage == "buffer_shoals"):
+            result = depth_array.copy()
+            start = time.time()
+            if(engine == "loop"):
+                RollingCoin_V2.buffer_shoals(result, nodata)
+            else:
+                RollingCoin_V2.buffer_shoals_numpy(result, nodata)
+            return time.time() - start, result
+
+        if(stage == "roll_coin"):
+            buffered_array = depth_array.copy()
+            RollingCoin_V2.buffer_shoals_numpy(buffered_array, nodata)
+            result = numpy.full((depth_array.shape[0], depth_array.shape[1]), 10000, dtype = numpy.float32)
+            start = time.time()
+            if(engine == "loop"):
+                RollingCoin_V2.roll_coin(buffered_array, result, coin, radius - 1, nodata)
+            else:
+                RollingCoin_V2.roll_coin_numpy(buffered_array, result, coin, radius - 1, nodata)
+            return time.time() - start, result
+
+        if(stage == "main"):
+            inpath = os.path.join(workdir, "depth_model.tif")
+            outpath = os.path.join(workdir, "surface.tif")
+            write_depth_model(inpath, depth_array, nodata)
+            start = time.time()
+            RollingCoin_V2.main(inpath, outpath, radius, trim, engine)
+            return time.time() - start, None
+
+    raise Exception("Unknown benchmark stage: " + version + " " + stage)
+
+
+#
+# Returns the output array of the main stage computed in memory (V1 contour limits, V2 surface).
+# coin: V1 coin, None uses create_coin.
+#
+def main_result(version, engine, depth_array, radius, trim, coin = None):
+    if(version == "V1"):
+        valid_depths = depth_array[depth_array != nodata_value]
+        levels = RollingCoin_V1.contour_levels(main_contour_list, (valid_depths.min(), valid_depths.max()))
+        if(coin is None):
+            coin = RollingCoin_V1.create_coin(radius)
+            radius = RollingCoin_V1.coin_roll_radius(engine, radius, None, None)
+        return RollingCoin_V1.create_contour_limits(depth_array, nodata_value, 15000, coin, radius, levels, engine)
+
+    return RollingCoin_V2.create_surface(depth_array.copy(), nodata_value, RollingCoin_V2.create_coin(radius, trim), radius - 1, engine)
+
+
+#
+# Runs one benchmark case (in a worker process of its own) and returns its result record.
+#
+def measure_case(case):
+    workdir = tempfile.mkdtemp(prefix = "rollingcoin_benchmark_")
+    try:
+        depth_array = synthetic_depth_model(case["size"], case["size"], case["seed"])
+        memory_before = RollingCoin_Report.peak_rss_mb()
+        elapsed, result = run_stage(case["version"], case["stage"], case["engine"], depth_array, case["radius"], case["trim"], workdir)
+
+        record = dict(case)
+        record["wall_time"] = elapsed
+        record["cells"] = case["size"] * case["size"]
+        record["cells_per_second"] = record["cells"] / max(elapsed, 1e-9)
+        record["peak_rss_mb"] = RollingCoin_Report.peak_rss_mb()
+        record["model_rss_mb"] = memory_before   # Peak memory before the stage (synthetic model generation)
+        return record
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+
+#
+# Runs the benchmark sweep and writes the results to a JSON file.
+#
+def run_benchmark(sizes, radii, trims, versions, stages, selected_engines, output_path, max_loop_cells, seed):
+    records = []
+
+    for size in sizes:
+        for version in versions:
+            for stage in stages:
+                for engine in engines[(version, stage)]:
+                    if(selected_engines is not None and engine not in selected_engines):
+                        continue
+                    if(engine in slow_engines and size * size > max_loop_cells):
+                        continue
+
+                    for radius in radii:
+                        for trim in (trims if version == "V2" else [True]): # V1 coin is always trimmed
+                            case = {"version": version, "stage": stage, "engine": engine, "size": size,
+                                    "radius": radius, "trim": trim, "seed": seed}
+                            print "Running", version, stage, engine, "size", size, "radius", radius, "trim", trim, ".."
+
+                            pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+                            try:
+                                record = pool.apply(measure_case, (case,))
+                            except Exception, e:
+                                print "  Failed:", e
+                                record = dict(case)
+                                record["error"] = str(e)
+                            finally:
+                                pool.terminate()
+
+                            if("wall_time" in record):
+                                print "  %.2f s, %.0f cells/s, peak %s MB" % (record["wall_time"], record["cells_per_second"], record["peak_rss_mb"])
+                            records.append(record)
+
+                            # Write after every case, so partial results survive long runs:
+                            with open(output_path, "w") as output:
+                                json.dump({"created": time.ctime(), "records": records}, output, indent = 2)
+
+    return records
+
+
+#
+# "Main method": parses command line arguments.
+#
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Rolling Coin benchmark")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [500, 1000, 2000, 5000, 10000, 20000], help = "Model sizes (cells per side)")
+    parser.add_argument("--radii", type = int, nargs = "+", default = [5, 10, 20], help = "Coin radii (cells)")
+    parser.add_argument("--trim", type = int, nargs = "+", default = [1, 0], help = "V2 coin trim flags (1 / 0)")
+    parser.add_argument("--versions", nargs = "+", default = ["V1", "V2"])
+    parser.add_argument("--stages", nargs = "+", default = ["buffer_shoals", "roll_coin", "main"])
+    parser.add_argument("--engines", nargs = "+", default = None, help = "Engines to run (default: all)")
+    parser.add_argument("--max-loop-cells", type = int, default = 500 * 500, help = "Largest model for cell-by-cell engines")
+    parser.add_argument("--seed", type = int, default = 0, help = "Synthetic model seed")
+    parser.add_argument("--output", default = "benchmark.json", help = "JSON result file")
+    args = parser.parse_args(argv)
+
+    run_benchmark(args.sizes, args.radii, [trim == 1 for trim in args.trim], args.versions, args.stages, args.engines,
+                  args.output, args.max_loop_cells, args.seed)
+    print "\nResults written to", args.output
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
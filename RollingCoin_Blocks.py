@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# NoData block index shared by RollingCoin_V1 and RollingCoin_V2.
+# Blocks that are all NoData are skipped, the other blocks are processed in windows with a halo like tiles.
+
+# Depends on:
+# 1. NumPy (see http://www.numpy.org/)
+# 2. RollingCoin_Tiles.py
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import numpy
+import RollingCoin_Tiles
+
+
+# Block classes:
+nodata_block = 0
+data_block = 1
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the block index of an array: class (nodata_block or data_block) of each block_size x block_size block.
+# nodata None means no NoData cells.
+#
+def block_index(array, nodata, block_size):
+    rows = array.shape[0]
+    columns = array.shape[1]
+    block_rows = -(-rows // block_size)
+    block_columns = -(-columns // block_size)
+
+    if(nodata is None):
+        return numpy.full((block_rows, block_columns), data_block, dtype = numpy.int8)
+
+    # NoData cells and all cells per block (array padded to whole blocks):
+    padded = numpy.zeros((block_rows * block_size, block_columns * block_size), dtype = numpy.bool_)
+    padded[:rows, :columns] = array == nodata
+    nodata_cells = padded.reshape(block_rows, block_size, block_columns, block_size).sum(axis = 3).sum(axis = 1)
+
+    block_heights = numpy.minimum(block_size, rows - numpy.arange(block_rows) * block_size)
+    block_widths = numpy.minimum(block_size, columns - numpy.arange(block_columns) * block_size)
+    cells = block_heights.reshape(block_rows, 1) * block_widths.reshape(1, block_columns)
+
+    index = numpy.full((block_rows, block_columns), data_block, dtype = numpy.int8)
+    index[nodata_cells == cells] = nodata_block
+    return index
+
+
+#
+# Returns a dictionary of block counts by class and the number of cells in NoData blocks (not processed).
+#
+def block_statistics(index, block_size, rows, columns):
+    block_heights = numpy.minimum(block_size, rows - numpy.arange(index.shape[0]) * block_size)
+    block_widths = numpy.minimum(block_size, columns - numpy.arange(index.shape[1]) * block_size)
+    cells = block_heights.reshape(index.shape[0], 1) * block_widths.reshape(1, index.shape[1])
+
+    return {
+        "nodata_blocks": int(numpy.count_nonzero(index == nodata_block)),
+        "data_blocks": int(numpy.count_nonzero(index == data_block)),
+        "skipped_cells": int(cells[index == nodata_block].sum()),
+    }
+
+
+#
+# Returns (read window, write window) pairs covering the active blocks (boolean block array, e.g. index != nodata_block):
+# runs of active blocks on each block row, merged with the same runs on the following block rows.
+#
+def block_windows(active_blocks, block_size, halo, rows, columns):
+    runs = {}       # (first block column, last block column + 1) -> [first block row, last block row + 1]
+    spans = []
+
+    for block_row in range(active_blocks.shape[0]):
+        active = numpy.concatenate(([False], active_blocks[block_row], [False]))
+        changes = numpy.flatnonzero(active[1:] != active[:-1])
+        row_runs = zip(changes[0::2], changes[1::2])
+
+        # Close runs that do not continue on this block row:
+        for run in runs.keys():
+            if(run not in row_runs):
+                spans.append((run, runs.pop(run)))
+
+        for run in row_runs:
+            if(run in runs):
+                runs[run][1] = block_row + 1
+            else:
+                runs[run] = [block_row, block_row + 1]
+
+    for run in runs.keys():
+        spans.append((run, runs[run]))
+
+    windows = []
+    for (first_column, end_column), (first_row, end_row) in sorted(spans, key = lambda span: (span[1][0], span[0][0])):
+        xoff = first_column * block_size
+        yoff = first_row * block_size
+        xsize = min(end_column * block_size, columns) - xoff
+        ysize = min(end_row * block_size, rows) - yoff
+
+        read_xoff = max(0, xoff - halo)
+        read_yoff = max(0, yoff - halo)
+        read_xsize = min(columns, xoff + xsize + halo) - read_xoff
+        read_ysize = min(rows, yoff + ysize + halo) - read_yoff
+
+        windows.append(((read_xoff, read_yoff, read_xsize, read_ysize), (xoff, yoff, xsize, ysize)))
+
+    return windows
+
+
+#
+# Processes an array block-wise: NoData blocks get fill_value, data blocks are processed by function(window_array, *args).
+# Only an array without NoData blocks takes a fast path (one call), NoData cells in data blocks are left to function.
+# Returns the output array, or None if function returns None for any window.
+#
+def process_blocks(data_array, index, block_size, halo, fill_value, dtype, function, args):
+    rows = data_array.shape[0]
+    columns = data_array.shape[1]
+
+    if(numpy.all(index == data_block)):
+        return function(data_array, *args)
+
+    dest_array = numpy.full((rows, columns), fill_value, dtype = dtype)
+    windows = block_windows(index != nodata_block, block_size, halo, rows, columns)
+    return process_windows(data_array, dest_array, windows, function, args)
+
+
+#
+# Processes (read window, write window) pairs of an array with function(window_array, *args) into dest_array.
+# Returns dest_array, or None if function returns None for any window.
+#
+def process_windows(data_array, dest_array, windows, function, args):
+    for read_window, write_window in windows:
+        xoff, yoff, xsize, ysize = read_window
+        window_array = numpy.array(data_array[yoff : yoff + ysize, xoff : xoff + xsize])  # Private copy, function may modify it
+        result_array = function(window_array, *args)
+        if(result_array is None):
+            return None
+
+        dest_array[write_window[1] : write_window[1] + write_window[3], write_window[0] : write_window[0] + write_window[2]] = \
+            RollingCoin_Tiles.crop_to_window(result_array, read_window, write_window)
+
+    return dest_array
+
+
+#
+# Tile function for RollingCoin_Tiles.process_tiled: indexes the tile and processes it block-wise (process_blocks).
+#
+def process_tile_blocks(tile_array, nodata, block_size, halo, fill_value, dtype, function, args):
+    index = block_index(tile_array, nodata, block_size)
+    return process_blocks(tile_array, index, block_size, halo, fill_value, dtype, function, args)
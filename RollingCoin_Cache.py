@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# On-disk result cache shared by RollingCoin_V1 and RollingCoin_V2: outputs are stored under a hash of the
+# input raster and the parameters that change the result. Least recently used entries are removed over the size cap.
+#
+# Cache directory layout:
+#   results/<key>/<output number><extension>    Output files of one run (e.g. 0.tif, 1.shp, 1.dbf ..)
+#   arrays/<key>.npy                            Rolled arrays of tiles / block windows
+
+# Depends on:
+# 1. GDAL (see http://www.gdal.org/)
+# 2. NumPy (see http://www.numpy.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+import glob
+import shutil
+import hashlib
+import tempfile
+import numpy
+
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Adds key parts to a hash: arrays by content, shape and data type, other values by their representation.
+#
+def update_hash(digest, parts):
+    for part in parts:
+        if(isinstance(part, numpy.ndarray)):
+            digest.update(str(part.dtype) + str(part.shape))
+            digest.update(numpy.ascontiguousarray(part).data)
+        else:
+            digest.update(repr(part))
+
+
+#
+# Returns the cache key of a GDAL dataset (band 1, hashed in strips) and processing parameters.
+#
+def raster_key(data, parameters):
+    band = data.GetRasterBand(1)
+    digest = hashlib.sha256()
+    update_hash(digest, [band.XSize, band.YSize, band.DataType, band.GetNoDataValue(), data.GetGeoTransform(), data.GetProjection()])
+
+    strip_rows = max(1, band.GetBlockSize()[1])
+    for yoff in range(0, band.YSize, strip_rows):
+        update_hash(digest, [band.ReadAsArray(0, yoff, band.XSize, min(strip_rows, band.YSize - yoff))])
+
+    update_hash(digest, sorted(parameters.items()))
+    return digest.hexdigest()
+
+
+#
+# Returns the files of an output path: the file and its sidecar files (e.g. .shx, .dbf and .prj of a shapefile).
+#
+def output_files(path):
+    base = os.path.splitext(path)[0]
+    return [name for name in glob.glob(base + ".*") if os.path.splitext(name)[0] == base]
+
+
+#
+# Copies the files of a cache entry to the output paths. Returns TRUE on a hit, FALSE if the key is not cached.
+#
+def restore_result(cache_directory, key, outputs):
+    entry = os.path.join(cache_directory, "results", key)
+    if(os.path.isdir(entry) == False):
+        return False
+
+    for name in os.listdir(entry):
+        number, extension = os.path.splitext(name)
+        shutil.copyfile(os.path.join(entry, name), os.path.splitext(outputs[int(number)])[0] + extension)
+
+    os.utime(entry, None) # Most recently used
+    return True
+
+
+#
+# Stores the files of the output paths as a cache entry.
+#
+def store_result(cache_directory, key, outputs):
+    # Incomplete results (e.g. contours not generated) are not cached:
+    if(not all([os.path.exists(path) for path in outputs])):
+        return
+
+    results = os.path.join(cache_directory, "results")
+    if(os.path.isdir(results) == False):
+        os.makedirs(results)
+
+    # Write to a temporary directory first, so a cache entry is always complete:
+    temporary = tempfile.mkdtemp(dir = results)
+    for number, path in enumerate(outputs):
+        for name in output_files(path):
+            shutil.copyfile(name, os.path.join(temporary, str(number) + os.path.splitext(name)[1]))
+
+    entry = os.path.join(results, key)
+    try:
+        os.rename(temporary, entry)
+    except OSError:
+        if(os.path.isdir(entry) == False):
+            raise
+        shutil.rmtree(temporary, ignore_errors = True) # Stored meanwhile by another run
+
+
+#
+# Runs function(*args, **kwargs) through the result cache. Returns None on a hit (outputs copied), otherwise
+# the return value of function. Entries over max_bytes are removed after the run.
+#
+def cached_run(cache_directory, max_bytes, key, outputs, function, args, kwargs):
+    if(restore_result(cache_directory, key, outputs) == True):
+        print "\nCached result found (" + key[:12] + "), outputs restored:", ", ".join(outputs)
+        return None
+
+    try:
+        result = function(*args, **kwargs)
+        store_result(cache_directory, key, outputs)
+    finally:
+        evict(cache_directory, max_bytes)
+    return result
+
+
+#
+# Returns the size of a file or a directory (all files) in bytes.
+#
+def entry_size(path):
+    if(os.path.isdir(path) == False):
+        return os.path.getsize(path)
+    return sum([os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)])
+
+
+#
+# Removes least recently used cache entries until the cache is at most max_bytes: arrays first, then results.
+#
+def evict(cache_directory, max_bytes):
+    if(max_bytes is None):
+        return
+
+    entries = []
+    for order, subdirectory in enumerate(("arrays", "results")):
+        directory = os.path.join(cache_directory, subdirectory)
+        if(os.path.isdir(directory)):
+            for name in os.listdir(directory):
+                if(name.startswith("tmp")):
+                    continue # Entry being written
+                path = os.path.join(directory, name)
+                entries.append((order, os.path.getmtime(path), path, entry_size(path)))
+
+    total = sum([size for order, used, path, size in entries])
+    for order, used, path, size in sorted(entries):
+        if(total <= max_bytes):
+            break
+        if(os.path.isdir(path)):
+            shutil.rmtree(path, ignore_errors = True)
+        else:
+            os.remove(path)
+        total -= size
+
+
+#
+# Returns the array cache settings for a cache directory (None disables the cache), passed on as an argument.
+#
+def array_cache_settings(directory):
+    if(directory is None):
+        return None
+    return {"directory": directory}
+
+
+#
+# Returns function(*args) through the array cache (array_cache_settings), keyed by name and key_parts.
+# None results are not cached, entries are evicted by cached_run.
+#
+def cached_array(array_cache, name, key_parts, function, args):
+    if(array_cache is None):
+        return function(*args)
+
+    digest = hashlib.sha256()
+    update_hash(digest, [name] + list(key_parts))
+    arrays = os.path.join(array_cache["directory"], "arrays")
+    path = os.path.join(arrays, digest.hexdigest() + ".npy")
+
+    if(os.path.exists(path)):
+        os.utime(path, None) # Most recently used
+        return numpy.load(path)
+
+    result = function(*args)
+    if(result is None):
+        return None
+
+    if(os.path.isdir(arrays) == False):
+        try:
+            os.makedirs(arrays)
+        except OSError:
+            pass # Created meanwhile by another worker
+
+    # Write to a temporary file first, so a cached array is always complete:
+    handle, temporary = tempfile.mkstemp(dir = arrays)
+    with os.fdopen(handle, "wb") as output:
+        numpy.save(output, result)
+    try:
+        os.rename(temporary, path)
+    except OSError:
+        if(os.path.exists(path) == False):
+            raise
+        os.remove(temporary) # Stored meanwhile by another worker (Windows does not replace files on rename)
+
+    return result
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Coin focal filters shared by RollingCoin_V1 and RollingCoin_V2.
+# The coin is split into horizontal chords, each filtered with a van Herk / Gil-Werman sliding max / min.
+
+# Depends on:
+# 1. NumPy (see http://www.numpy.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import numpy
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the part of the coin that check_coin and roll_coin visit (indexes 0 ... 2 * radius).
+#
+def coin_footprint(coin, radius):
+    return coin[0 : 2 * radius + 1, 0 : 2 * radius + 1]
+
+
+#
+# Splits a coin footprint into horizontal chords: list of (row, first column, width) tuples.
+#
+def coin_chords(footprint):
+    chords = []
+    for row in range(footprint.shape[0]):
+        col = 0
+        while(col < footprint.shape[1]):
+            if(footprint[row, col] == True):
+                width = 1
+                while(col + width < footprint.shape[1] and footprint[row, col + width] == True):
+                    width += 1
+                chords.append((row, col, width))
+                col += width
+            else:
+                col += 1
+    return chords
+
+
+#
+# Returns the value that never wins a numpy.fmax / numpy.fmin (or maximum / minimum) comparison for dtype.
+#
+def filter_fill(dtype, ufunc):
+    if(dtype == numpy.bool_):
+        return ufunc not in (numpy.fmax, numpy.maximum)
+    if(numpy.issubdtype(dtype, numpy.floating)):
+        return -numpy.inf if ufunc in (numpy.fmax, numpy.maximum) else numpy.inf
+    limits = numpy.iinfo(dtype)
+    return limits.min if ufunc in (numpy.fmax, numpy.maximum) else limits.max
+
+
+#
+# Sliding window max / min along rows (van Herk / Gil-Werman): result[i, j] = ufunc over array[i, j : j + width].
+#
+def sliding_filter(array, width, ufunc, fill):
+    rows = array.shape[0]
+    columns = array.shape[1]
+    if(width == 1):
+        return array
+
+    blocks = -(-columns // width)   # Number of blocks (rounded up)
+    padded = numpy.full((rows, blocks, width), fill, dtype = array.dtype)
+    padded.reshape(rows, blocks * width)[:, :columns] = array
+
+    forward = ufunc.accumulate(padded, axis = 2).reshape(rows, blocks * width)
+    backward = ufunc.accumulate(padded[:, :, ::-1], axis = 2)[:, :, ::-1].reshape(rows, blocks * width)
+    del padded
+
+    result_columns = columns - width + 1
+    return ufunc(backward[:, :result_columns], forward[:, width - 1 : width - 1 + result_columns])
+
+
+#
+# Coin focal max / min for all coin positions inside the array (shape - footprint shape + 1).
+# Returns None for an empty coin.
+#
+def coin_filter(array, footprint, ufunc):
+    return coin_filters(array, [footprint], ufunc)[0]
+
+
+#
+# coin_filter for several coin footprints at once, sharing the sliding filters. Returns a list of results.
+#
+def coin_filters(array, footprints, ufunc):
+    fill = filter_fill(array.dtype, ufunc)
+    coins_chords = [coin_chords(footprint) for footprint in footprints]
+    results = [None] * len(footprints)
+
+    for width in sorted(set([chord[2] for chords in coins_chords for chord in chords])):
+        filtered = sliding_filter(array, width, ufunc, fill)    # Shared by all chords of this width
+
+        for number, footprint in enumerate(footprints):
+            inner_rows = array.shape[0] - footprint.shape[0] + 1
+            inner_columns = array.shape[1] - footprint.shape[1] + 1
+
+            for row, col, chord_width in coins_chords[number]:
+                if(chord_width != width):
+                    continue
+                window = filtered[row : row + inner_rows, col : col + inner_columns]
+                if(results[number] is None):
+                    results[number] = window.copy()
+                else:
+                    ufunc(results[number], window, out = results[number])
+
+    return results
+
+
+#
+# Spreads coin values back over the coin area (reverse of coin_filter, shape + footprint shape - 1).
+# Cells not covered by any coin get the fill value of ufunc.
+#
+def coin_spread(array, footprint, ufunc):
+    rows = array.shape[0] + footprint.shape[0] - 1
+    columns = array.shape[1] + footprint.shape[1] - 1
+    fill = filter_fill(array.dtype, ufunc)
+    chords = coin_chords(footprint)
+    result = numpy.full((rows, columns), fill, dtype = array.dtype)
+
+    for width in sorted(set([chord[2] for chord in chords])):
+        # Sliding filter over the values padded by width - 1 cells on both sides:
+        padded = numpy.full((array.shape[0], array.shape[1] + 2 * (width - 1)), fill, dtype = array.dtype)
+        padded[:, width - 1 : width - 1 + array.shape[1]] = array
+        filtered = sliding_filter(padded, width, ufunc, fill)
+        del padded
+
+        for row, col, chord_width in chords:
+            if(chord_width != width):
+                continue
+            window = result[row : row + array.shape[0], col : col + filtered.shape[1]]
+            ufunc(window, filtered, out = window)
+
+    return result
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Incremental update helpers shared by RollingCoin_V1 and RollingCoin_V2: only windows within the processing
+# reach (see RollingCoin_Tiles.tile_halo) of changed blocks are recomputed and written into the previous output.
+
+# Depends on:
+# 1. NumPy (see http://www.numpy.org/)
+# 2. RollingCoin_Blocks.py and RollingCoin_Tiles.py
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import numpy
+import RollingCoin_Blocks
+import RollingCoin_Tiles
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Compares two GDAL bands of the same size block by block. Returns a boolean block array: TRUE where any cell differs.
+#
+def changed_blocks(previous_band, band, block_size):
+    rows = band.YSize
+    columns = band.XSize
+    block_rows = -(-rows // block_size)
+    block_columns = -(-columns // block_size)
+    changed = numpy.zeros((block_rows, block_columns), dtype = numpy.bool_)
+
+    for block_row in range(block_rows):
+        yoff = block_row * block_size
+        ysize = min(block_size, rows - yoff)
+        previous_strip = previous_band.ReadAsArray(0, yoff, columns, ysize)
+        strip = band.ReadAsArray(0, yoff, columns, ysize)
+
+        differs = previous_strip != strip
+        if(numpy.issubdtype(strip.dtype, numpy.floating)):
+            differs &= ~(numpy.isnan(previous_strip) & numpy.isnan(strip))
+
+        # Any changed cell per block of the strip:
+        changed_columns = numpy.flatnonzero(differs.any(axis = 0))
+        changed[block_row, numpy.unique(changed_columns // block_size)] = True
+
+    return changed
+
+
+#
+# Returns the windows to recompute: changed blocks grown by halo cells, (read window, write window) pairs.
+#
+def update_windows(changed, block_size, halo, rows, columns):
+    reach = -(-halo // block_size)
+    block_rows = changed.shape[0]
+    block_columns = changed.shape[1]
+
+    padded = numpy.zeros((block_rows + 2 * reach, block_columns + 2 * reach), dtype = numpy.bool_)
+    padded[reach : reach + block_rows, reach : reach + block_columns] = changed
+    affected = numpy.zeros((block_rows, block_columns), dtype = numpy.bool_)
+    for row_shift in range(2 * reach + 1):
+        for col_shift in range(2 * reach + 1):
+            affected |= padded[row_shift : row_shift + block_rows, col_shift : col_shift + block_columns]
+
+    return RollingCoin_Blocks.block_windows(affected, block_size, halo, rows, columns)
+
+
+#
+# Recomputes windows of a band with function(window_array, *args) and writes them (without halo) to outband.
+# Returns the number of cells written.
+#
+def update_band(band, outband, windows, function, args):
+    cells = 0
+    for read_window, write_window in windows:
+        window_array = band.ReadAsArray(read_window[0], read_window[1], read_window[2], read_window[3])
+        result_array = function(window_array, *args)
+        outband.WriteArray(RollingCoin_Tiles.crop_to_window(result_array, read_window, write_window), write_window[0], write_window[1])
+        cells += write_window[2] * write_window[3]
+
+    outband.FlushCache()
+    return cells
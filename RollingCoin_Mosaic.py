@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Mosaic input helpers shared by RollingCoin_V1 and RollingCoin_V2: a VRT file, a list of files, a directory or
+# a file name pattern (e.g. R"D:\Survey\*.tif") is read through a VRT and processed source file by source file.
+
+# Depends on:
+# 1. GDAL 2.1 or newer (gdal.BuildVRT, see http://www.gdal.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+import glob
+from osgeo import gdal
+import RollingCoin_Output
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns TRUE if an input is a mosaic: a list of files, a directory, a file name pattern or a VRT file.
+#
+def is_mosaic(inputs):
+    if(isinstance(inputs, (list, tuple))):
+        return True
+    return os.path.isdir(inputs) or glob.has_magic(inputs) or os.path.splitext(inputs)[1].lower() == ".vrt"
+
+
+#
+# Returns the source files of a mosaic input (files of a list, directory (*.tif, *.tiff), pattern or VRT file).
+#
+def source_files(inputs):
+    if(isinstance(inputs, (list, tuple))):
+        files = list(inputs)
+    elif(os.path.isdir(inputs)):
+        files = sorted(glob.glob(os.path.join(inputs, "*.tif")) + glob.glob(os.path.join(inputs, "*.tiff")))
+    elif(os.path.splitext(inputs)[1].lower() == ".vrt"):
+        files = gdal.Open(inputs).GetFileList()[1:]   # First file is the VRT itself
+    else:
+        files = sorted(glob.glob(inputs))
+
+    if(len(files) == 0):
+        raise Exception("No source files found: " + str(inputs))
+    return files
+
+
+#
+# Builds a VRT of raster files, written to path or kept in memory (path ""). Returns the GDAL dataset.
+#
+def build_vrt(paths, path = ""):
+    data = gdal.BuildVRT(path, paths)
+    if(path != ""):
+        data = None # Close (write) the VRT file
+        data = gdal.Open(path, gdal.GA_ReadOnly)
+    return data
+
+
+#
+# Opens a mosaic input, other than VRT files through a VRT written to directory (None: in memory).
+# Returns the GDAL dataset, the path of the VRT ("" in memory) and the list of source files.
+#
+def open_mosaic(inputs, directory = None):
+    files = source_files(inputs)
+    if(not isinstance(inputs, (list, tuple)) and os.path.splitext(inputs)[1].lower() == ".vrt"):
+        return gdal.Open(inputs, gdal.GA_ReadOnly), inputs, files
+
+    path = ""
+    if(directory is not None):
+        path = os.path.join(directory, "mosaic.vrt")
+    return build_vrt(files, path), path, files
+
+
+#
+# Returns the window (xoff, yoff, xsize, ysize) of a source file in the mosaic (on the cell grid of the mosaic).
+#
+def source_window(data, path):
+    geotransform = data.GetGeoTransform()
+    source = gdal.Open(path, gdal.GA_ReadOnly)
+    source_geotransform = source.GetGeoTransform()
+    if(source_geotransform[1] != geotransform[1] or source_geotransform[5] != geotransform[5]):
+        raise Exception("Cell size of " + path + " differs from the mosaic.")
+
+    xoff = (source_geotransform[0] - geotransform[0]) / geotransform[1]
+    yoff = (source_geotransform[3] - geotransform[3]) / geotransform[5]
+    if(abs(xoff - round(xoff)) > 0.001 or abs(yoff - round(yoff)) > 0.001):
+        raise Exception(path + " is not aligned to the cells of the mosaic.")
+    return int(round(xoff)), int(round(yoff)), source.RasterXSize, source.RasterYSize
+
+
+#
+# Returns the source tiles of a mosaic for RollingCoin_Tiles.process_tiled: source file windows grown by halo cells.
+#
+def source_tiles(data, files, halo):
+    tiles = []
+    for path in files:
+        xoff, yoff, xsize, ysize = source_window(data, path)
+        read_xoff = max(0, xoff - halo)
+        read_yoff = max(0, yoff - halo)
+        read_xsize = min(data.RasterXSize, xoff + xsize + halo) - read_xoff
+        read_ysize = min(data.RasterYSize, yoff + ysize + halo) - read_yoff
+        tiles.append(((read_xoff, read_yoff, read_xsize, read_ysize), (xoff, yoff, xsize, ysize)))
+    return tiles
+
+
+#
+# Output band of RollingCoin_Tiles.process_tiled writing the source tiles to their own output tiles.
+#
+class TileOutputs(object):
+    def __init__(self, tiles, datasets):
+        self.datasets = datasets
+        self.bands = dict([((write_window[0], write_window[1]), data.GetRasterBand(1)) for (read_window, write_window), data in zip(tiles, datasets)])
+
+    def WriteArray(self, array, xoff, yoff):
+        return self.bands[(xoff, yoff)].WriteArray(array, 0, 0)
+
+    def FlushCache(self):
+        for band in self.bands.values():
+            band.FlushCache()
+
+
+#
+# Returns the output tile paths of the source files in directory (same names, GeoTIFF).
+#
+def tile_paths(files, directory):
+    return [os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + ".tif") for path in files]
+
+
+#
+# Creates the output tiles of the source tiles with an output profile (copied profiles: temporary GeoTIFFs first).
+# Returns the paths written to and the TileOutputs band.
+#
+def create_tile_outputs(files, tiles, paths, data_type, profile, copied, nodata):
+    work_paths = []
+    datasets = []
+    for source_path, path, (read_window, write_window) in zip(files, paths, tiles):
+        work_path, work_profile = RollingCoin_Output.work_output(path, profile, True, copied)
+        source = gdal.Open(source_path, gdal.GA_ReadOnly)
+        datasets.append(RollingCoin_Output.create_output(work_path, write_window[2], write_window[3], data_type, work_profile, source, nodata))
+        work_paths.append(work_path)
+    return work_paths, TileOutputs(tiles, datasets)
+
+
+#
+# Returns the output tile paths and the source file windows of a mosaic (cache key parts of output tiles).
+#
+def cached_tile_outputs(data, files, directory):
+    return tile_paths(files, directory), [source_window(data, path) for path in files]
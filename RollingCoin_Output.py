@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Output raster profiles shared by RollingCoin_V1 and RollingCoin_V2.
+# COG outputs are copied from a memory dataset or a temporary tiled GeoTIFF at the end of the run.
+#
+# Profiles:
+#   "default"   GDAL defaults (striped, uncompressed)
+#   "tiled"     Internally tiled (512 x 512 cells), uncompressed
+#   "deflate"   Tiled, DEFLATE compressed with predictor
+#   "zstd"      Tiled, ZSTD compressed with predictor (GDAL built with ZSTD support)
+#   "cog"       Cloud Optimized GeoTIFF, DEFLATE compressed with overviews (GDAL 3.1 or newer)
+
+# Depends on:
+# 1. GDAL (see http://www.gdal.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+from osgeo import gdal
+
+
+# GeoTIFF creation options of each profile ("cog" uses the COG driver, "memory" is an in-memory dataset):
+tiled_options = ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "BIGTIFF=IF_SAFER"]
+output_profiles = {
+    "default": [],
+    "tiled": tiled_options,
+    "deflate": tiled_options + ["COMPRESS=DEFLATE", "ZLEVEL=6"],
+    "zstd": tiled_options + ["COMPRESS=ZSTD", "ZSTD_LEVEL=9"],
+    "cog": ["COMPRESS=DEFLATE", "PREDICTOR=YES", "BLOCKSIZE=512", "OVERVIEWS=AUTO", "BIGTIFF=IF_SAFER"],
+    "memory": [],
+}
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the GDAL creation options of a profile for a data type (predictor by data type).
+#
+def creation_options(profile, data_type):
+    if(profile not in output_profiles):
+        raise ValueError("Unknown output profile: " + str(profile))
+
+    options = list(output_profiles[profile])
+    if(profile in ("deflate", "zstd")):
+        if(data_type in (gdal.GDT_Float32, gdal.GDT_Float64)):
+            options.append("PREDICTOR=3")
+        else:
+            options.append("PREDICTOR=2")
+    return options
+
+
+#
+# Returns TRUE if the profile is written as a copy of a finished raster (see work_output).
+#
+def copied_profile(profile):
+    return profile == "cog"
+
+
+#
+# Returns a temporary GeoTIFF path next to an output path.
+#
+def temporary_path(path, suffix = "_tmp"):
+    base, extension = os.path.splitext(path)
+    return base + suffix + ".tif"
+
+
+#
+# Returns the (path, profile) results are written to while processing: the output itself, or with copied = TRUE
+# a memory dataset (whole array) or a temporary tiled GeoTIFF (tiled = TRUE, path with suffix).
+#
+def work_output(path, profile, tiled, copied, suffix = "_tmp"):
+    if(copied == False):
+        return path, profile
+    if(tiled == False):
+        return "", "memory"
+    return temporary_path(path, suffix), "tiled"
+
+
+#
+# Creates and returns a one band output raster with the georeferencing of source (GDAL dataset) and NoData value.
+#
+def create_output(path, xsize, ysize, data_type, profile, source, nodata):
+    if(profile == "memory"):
+        outdata = gdal.GetDriverByName("MEM").Create("", xsize, ysize, 1, data_type)
+    else:
+        outdata = gdal.GetDriverByName("GTiff").Create(path, xsize, ysize, 1, data_type, options = creation_options(profile, data_type))
+    outdata.GetRasterBand(1).SetNoDataValue(nodata)
+    outdata.SetGeoTransform(source.GetGeoTransform())
+    outdata.SetProjection(source.GetProjection())
+    return outdata
+
+
+#
+# Writes a finished raster (GDAL dataset) to path with a profile. COG overviews are resampled with resampling
+# ("NEAREST" for classes and depths, averaging would hide shoals).
+#
+def copy_output(source, path, profile, resampling):
+    if(profile == "cog"):
+        outdata = gdal.GetDriverByName("COG").CreateCopy(path, source, 0, options = creation_options(profile, source.GetRasterBand(1).DataType) + ["RESAMPLING=" + resampling])
+    else:
+        outdata = gdal.GetDriverByName("GTiff").CreateCopy(path, source, 0, options = creation_options(profile, source.GetRasterBand(1).DataType))
+    outdata = None # Close dataset
+
+
+#
+# Returns TRUE if an output raster (GDAL dataset) has overviews or the COG layout: windows can not be updated in place.
+#
+def has_overviews(data):
+    if(data.GetRasterBand(1).GetOverviewCount() > 0):
+        return True
+    return data.GetMetadataItem("LAYOUT", "IMAGE_STRUCTURE") == "COG"
+
+
+#
+# Removes a temporary output raster (nothing to remove for memory datasets).
+#
+def remove_output(path):
+    if(path != "" and os.path.exists(path)):
+        gdal.GetDriverByName("GTiff").Delete(path)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Run report helpers shared by RollingCoin_V1 and RollingCoin_V2: wall / CPU time, peak memory and cell counts
+# of each stage, written as JSON. One stage can be profiled with cProfile.
+
+# Depends on:
+# 1. NumPy (see http://www.numpy.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+import sys
+import json
+import math
+import time
+import cProfile
+import pstats
+import contextlib
+import numpy
+
+try:
+    import resource     # Peak memory, not available on Windows
+except ImportError:
+    resource = None
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns peak memory (resident set size) in megabytes, or None if not available.
+# children False: this process only, True: the largest finished child process (worker processes).
+#
+def peak_rss_mb(children = False):
+    if(resource is None):
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    if(sys.platform == "darwin"):
+        return peak / (1024.0 * 1024.0)     # Bytes on macOS
+    return peak / 1024.0                    # Kilobytes on Linux
+
+
+#
+# Returns CPU time (user + system) of this process and its finished child processes in seconds.
+#
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+#
+# Returns the number of cells and the number of nodata cells (NaN nodata supported) in an array.
+#
+def count_cells(array, nodata):
+    if(nodata is None):
+        return int(array.size), 0
+    if(isinstance(nodata, float) and math.isnan(nodata)):
+        return int(array.size), int(numpy.count_nonzero(numpy.isnan(array)))
+    return int(array.size), int(numpy.count_nonzero(array == nodata))
+
+
+#
+# Creates a new run report, or returns None if neither a report nor a profile is requested.
+# The profile of profile_stage is saved next to report_path (.prof), or printed by write_report without it.
+#
+def create_report(script, parameters, profile_stage = None, report_path = None):
+    if(report_path is None and profile_stage is None):
+        return None
+
+    profile_path = None
+    if(report_path is not None):
+        profile_path = os.path.splitext(report_path)[0] + ".prof"
+
+    return {
+        "script": script,
+        "parameters": parameters,
+        "started": time.ctime(),
+        "start_wall": time.time(),
+        "start_cpu": cpu_time(),
+        "profile_stage": profile_stage,
+        "profile_path": profile_path,
+        "stages": [],
+    }
+
+
+#
+# Measures one stage of a run: use as "with stage(report, name) as record:", cell counts etc. can be added to record.
+# Repeated runs of a stage (same name and level, e.g. block windows) are summed into one record.
+# Does nothing if report is None, so processing functions can take an optional report.
+#
+@contextlib.contextmanager
+def stage(report, name, level = None):
+    record = {"stage": name}
+    if(level is not None):
+        record["level"] = level
+
+    if(report is None):
+        yield record
+        return
+
+    profiler = None
+    if(report["profile_stage"] == name):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start_wall = time.time()
+    start_cpu = cpu_time()
+    try:
+        yield record
+    finally:
+        record["wall_time"] = time.time() - start_wall
+        record["cpu_time"] = cpu_time() - start_cpu
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["peak_children_rss_mb"] = peak_rss_mb(children = True)
+
+        if(profiler is not None):
+            profiler.disable()
+            record["profile"] = profile_summary(profiler)
+            if(report["profile_path"] is not None):
+                profiler.dump_stats(report["profile_path"])
+
+        merge_record(report, record)
+
+
+# Stage record fields summed over repeated runs of a stage:
+summed_fields = ["wall_time", "cpu_time", "cells", "nodata_cells", "features", "runs"]
+
+
+#
+# Adds a stage record to a report, or sums it into the record of an earlier run of the same stage and level.
+#
+def merge_record(report, record):
+    record["runs"] = 1
+    for previous in report["stages"]:
+        if(previous["stage"] == record["stage"] and previous.get("level") == record.get("level")):
+            for field in record:
+                if(field in summed_fields and field in previous):
+                    previous[field] += record[field]
+                elif(field not in previous or field in ["peak_rss_mb", "peak_children_rss_mb", "profile"]):
+                    previous[field] = record[field]
+            return
+    report["stages"].append(record)
+
+
+#
+# Returns the most expensive functions (cumulative time) of a profile as a list of dictionaries.
+#
+def profile_summary(profiler, count = 20):
+    stats = pstats.Stats(profiler).stats
+    functions = []
+    for (filename, line, function), (primitive_calls, calls, total_time, cumulative_time, callers) in stats.items():
+        functions.append({
+            "function": os.path.basename(filename) + ":" + str(line) + "(" + function + ")",
+            "calls": calls,
+            "total_time": total_time,
+            "cumulative_time": cumulative_time,
+        })
+    functions.sort(key = lambda item: item["cumulative_time"], reverse = True)
+    return functions[:count]
+
+
+#
+# Adds run totals to a report and writes it to a JSON file (path None: totals only, profile summary is printed).
+# Returns the report (None without a report).
+#
+def write_report(report, path):
+    if(report is None):
+        return None
+
+    report["ended"] = time.ctime()
+    report["wall_time"] = time.time() - report["start_wall"]
+    report["cpu_time"] = cpu_time() - report["start_cpu"]
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["peak_children_rss_mb"] = peak_rss_mb(children = True)
+
+    if(path is not None):
+        with open(path, "w") as output:
+            json.dump(report, output, indent = 2, sort_keys = True)
+    else:
+        print_profile(report)
+
+    return report
+
+
+#
+# Prints the profile summaries of a report.
+#
+def print_profile(report):
+    for record in report["stages"]:
+        if("profile" in record):
+            print "\nProfile of stage", record["stage"] + ("" if record.get("level") is None else " (level " + str(record["level"]) + ")") + ", last run:"
+            print "%10s %12s %12s  %s" % ("calls", "total (s)", "cumul. (s)", "function")
+            for function in record["profile"]:
+                print "%10d %12.3f %12.3f  %s" % (function["calls"], function["total_time"], function["cumulative_time"], function["function"])
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Tiled processing helpers shared by RollingCoin_V1 and RollingCoin_V2.
+# Each tile is read with a halo of extra cells, processed in memory and written out without the halo.
+# Tiles can also be processed by a pool of worker processes, or pipelined with background read / write threads.
+# map_shared runs independent tasks (e.g. V1 contour levels) over one shared array in the same way.
+
+# Depends on:
+# 1. GDAL (see http://www.gdal.org/)
+# 2. NumPy (see http://www.numpy.org/)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+import threading
+import Queue
+import numpy
+from osgeo import gdal
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the halo (in cells) needed around a tile: coin write + coin check + shoal buffer = 2 * radius + 1.
+# Radius is the radius passed to roll_coin (coin radius - 1).
+#
+def tile_halo(radius):
+    return 2 * radius + 1
+
+
+#
+# Returns tile size (columns, rows) rounded to whole GDAL blocks of the band (unless blocks are larger).
+#
+def aligned_tile_size(band, tile_size):
+    block_columns, block_rows = band.GetBlockSize()
+    tile_columns = tile_size
+    tile_rows = tile_size
+
+    if(block_columns <= tile_size):
+        tile_columns = (tile_size // block_columns) * block_columns
+    if(block_rows <= tile_size):
+        tile_rows = (tile_size // block_rows) * block_rows
+
+    return tile_columns, tile_rows
+
+
+#
+# Returns a list of tiles covering a raster: (read window, write window) pairs of (xoff, yoff, xsize, ysize).
+# Read windows are write windows grown by halo cells, clipped to the raster.
+#
+def tile_windows(columns, rows, tile_columns, tile_rows, halo):
+    tiles = []
+
+    for yoff in range(0, rows, tile_rows):
+        ysize = min(tile_rows, rows - yoff)
+        read_yoff = max(0, yoff - halo)
+        read_ysize = min(rows, yoff + ysize + halo) - read_yoff
+
+        for xoff in range(0, columns, tile_columns):
+            xsize = min(tile_columns, columns - xoff)
+            read_xoff = max(0, xoff - halo)
+            read_xsize = min(columns, xoff + xsize + halo) - read_xoff
+
+            tiles.append(((read_xoff, read_yoff, read_xsize, read_ysize), (xoff, yoff, xsize, ysize)))
+
+    return tiles
+
+
+#
+# Cuts the write window out of an array read with the read window.
+#
+def crop_to_window(tile_array, read_window, write_window):
+    row_start = write_window[1] - read_window[1]
+    col_start = write_window[0] - read_window[0]
+    return tile_array[row_start : row_start + write_window[3], col_start : col_start + write_window[2]]
+
+
+#
+# Returns the tiles of a GDAL band (see tile_windows) for a tile size rounded to whole GDAL blocks.
+#
+def band_tiles(band, tile_size, halo):
+    tile_columns, tile_rows = aligned_tile_size(band, tile_size)
+    return tile_windows(band.XSize, band.YSize, tile_columns, tile_rows, halo)
+
+
+#
+# Processes a GDAL band tile by tile and writes the results to another band of the same size.
+# function(tile_array, *args) must return an array shaped like tile_array. It may modify tile_array.
+# With workers set, tiles are processed in parallel (see process_tiled_parallel).
+# With pipeline set, tiles are read and written by background threads (see process_tiled_pipelined).
+# tiles: (read window, write window) pairs instead of the tile grid (e.g. mosaic source files), source_path: input for workers.
+#
+def process_tiled(band, outband, tile_size, halo, function, args, workers = None, pipeline = False, tiles = None, source_path = None):
+    if(tiles is None):
+        tiles = band_tiles(band, tile_size, halo)
+    if(workers is not None):
+        return process_tiled_parallel(band, outband, tile_size, halo, function, args, workers, pipeline, tiles, source_path)
+    if(pipeline == True):
+        return process_tiled_pipelined(band, outband, tile_size, halo, function, args, tiles = tiles)
+
+    for read_window, write_window in tiles:
+        tile_array = band.ReadAsArray(read_window[0], read_window[1], read_window[2], read_window[3])
+        result_array = function(tile_array, *args)
+        outband.WriteArray(crop_to_window(result_array, read_window, write_window), write_window[0], write_window[1])
+
+    outband.FlushCache()
+    return
+
+
+#
+# Puts an item to a bounded queue, waiting while the queue is full (backpressure).
+# Returns FALSE without putting if the pipeline is stopped meanwhile.
+#
+def pipeline_put(queue, item, stop):
+    while(True):
+        try:
+            queue.put(item, timeout = 0.1)
+            return True
+        except Queue.Full:
+            if(stop.is_set()):
+                return False
+
+
+#
+# Gets an item from a queue, waiting while the queue is empty. Returns None if the pipeline is stopped.
+#
+def pipeline_get(queue, stop):
+    while(True):
+        try:
+            return queue.get(timeout = 0.1)
+        except Queue.Empty:
+            if(stop.is_set()):
+                return None
+
+
+#
+# Reader thread: reads tiles (read window, write window, tile array) to read_queue, then None.
+#
+def read_tiles(band, tiles, read_queue, stop, errors):
+    try:
+        for read_window, write_window in tiles:
+            tile_array = band.ReadAsArray(read_window[0], read_window[1], read_window[2], read_window[3])
+            if(pipeline_put(read_queue, (read_window, write_window, tile_array), stop) == False):
+                return
+        pipeline_put(read_queue, None, stop)
+    except Exception, e:
+        errors.append(e)
+        stop.set()
+
+
+#
+# Writer thread: writes (write window, array) items of write_queue to outband until None.
+#
+def write_tiles(outband, write_queue, stop, errors):
+    try:
+        while(True):
+            item = pipeline_get(write_queue, stop)
+            if(item is None):
+                return
+            write_window, result_array = item
+            outband.WriteArray(result_array, write_window[0], write_window[1])
+    except Exception, e:
+        errors.append(e)
+        stop.set()
+
+
+#
+# Pipelined version of process_tiled: reader and writer threads run while this thread processes tiles.
+# Queues of queue_size tiles limit memory use.
+#
+def process_tiled_pipelined(band, outband, tile_size, halo, function, args, queue_size = 2, tiles = None):
+    if(tiles is None):
+        tiles = band_tiles(band, tile_size, halo)
+
+    read_queue = Queue.Queue(queue_size)
+    write_queue = Queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    reader = threading.Thread(target = read_tiles, args = (band, tiles, read_queue, stop, errors))
+    writer = threading.Thread(target = write_tiles, args = (outband, write_queue, stop, errors))
+    reader.daemon = True
+    writer.daemon = True
+    reader.start()
+    writer.start()
+
+    try:
+        while(True):
+            item = pipeline_get(read_queue, stop)
+            if(item is None):
+                break
+            read_window, write_window, tile_array = item
+            result_array = function(tile_array, *args)
+            if(pipeline_put(write_queue, (write_window, numpy.ascontiguousarray(crop_to_window(result_array, read_window, write_window))), stop) == False):
+                break
+
+        pipeline_put(write_queue, None, stop) # All tiles processed
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        reader.join()
+        writer.join()
+
+    if(len(errors) > 0):
+        raise errors[0]
+
+    outband.FlushCache()
+    return
+
+
+#
+# Writes (write window, array) results to outband on a writer thread while the results are collected.
+#
+def write_pipelined(outband, results, queue_size):
+    write_queue = Queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    writer = threading.Thread(target = write_tiles, args = (outband, write_queue, stop, errors))
+    writer.daemon = True
+    writer.start()
+
+    try:
+        for result in results:
+            if(pipeline_put(write_queue, result, stop) == False):
+                break
+        pipeline_put(write_queue, None, stop) # All tiles processed
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        writer.join()
+
+    if(len(errors) > 0):
+        raise errors[0]
+
+
+#
+# Copies a GDAL band to a memory-mapped file shared by the worker processes. Returns the path and data type.
+#
+def band_to_memmap(band, directory, strip_rows):
+    path = os.path.join(directory, "band.dat")
+    data_array = band.ReadAsArray(0, 0, band.XSize, 1)
+    mapped = numpy.memmap(path, dtype = data_array.dtype, mode = "w+", shape = (band.YSize, band.XSize))
+
+    for yoff in range(0, band.YSize, strip_rows):
+        ysize = min(strip_rows, band.YSize - yoff)
+        mapped[yoff : yoff + ysize, :] = band.ReadAsArray(0, yoff, band.XSize, ysize)
+
+    mapped.flush()
+    del mapped
+    return path, data_array.dtype
+
+
+# Worker process state (set once per worker by init_worker):
+worker_state = {}
+
+
+#
+# Pool initializer: opens the shared input read-only and stores the tile function.
+#
+def init_worker(path, dtype, shape, function, args):
+    worker_state["array"] = numpy.memmap(path, dtype = dtype, mode = "r", shape = shape)
+    worker_state["function"] = function
+    worker_state["args"] = args
+
+
+#
+# Pool initializer: opens the input raster read-only (GDAL) and stores the tile function.
+#
+def init_raster_worker(path, function, args):
+    worker_state["data"] = gdal.Open(path, gdal.GA_ReadOnly)
+    worker_state["array"] = worker_state["data"].GetRasterBand(1)
+    worker_state["function"] = function
+    worker_state["args"] = args
+
+
+#
+# Processes one tile in a worker process. Returns the write window and the processed tile without halo.
+#
+def process_worker_tile(windows):
+    read_window, write_window = windows
+    xoff, yoff, xsize, ysize = read_window
+
+    if("data" in worker_state):
+        tile_array = worker_state["array"].ReadAsArray(xoff, yoff, xsize, ysize)
+    else:
+        tile_array = numpy.array(worker_state["array"][yoff : yoff + ysize, xoff : xoff + xsize])   # Private copy of the tile
+    result_array = worker_state["function"](tile_array, *worker_state["args"])
+    return write_window, numpy.ascontiguousarray(crop_to_window(result_array, read_window, write_window))
+
+
+#
+# Processes one task in a worker process: function(shared array, task, *args).
+#
+def process_worker_task(task):
+    return worker_state["function"](worker_state["array"], task, *worker_state["args"])
+
+
+#
+# Copies an array to a memory-mapped file. Returns the path of the file.
+#
+def array_to_memmap(array, directory):
+    path = os.path.join(directory, "array.dat")
+    mapped = numpy.memmap(path, dtype = array.dtype, mode = "w+", shape = array.shape)
+    mapped[:] = array
+    mapped.flush()
+    del mapped
+    return path
+
+
+#
+# Runs function(array, task, *args) for each task in a pool of worker processes sharing a memory-mapped copy of array.
+# Yields the results in task order. workers = 0 uses all CPU cores, function must be picklable.
+#
+def map_shared(array, function, args, tasks, workers):
+    if(workers == 0):
+        workers = multiprocessing.cpu_count()
+
+    directory = tempfile.mkdtemp(prefix = "rollingcoin_")
+    pool = None
+    try:
+        path = array_to_memmap(array, directory)
+        pool = multiprocessing.Pool(min(workers, max(1, len(tasks))), init_worker, (path, array.dtype, array.shape, function, args))
+
+        for result in pool.imap(process_worker_task, tasks):
+            yield result
+
+        pool.close()
+        pool.join()
+        pool = None
+
+    finally:
+        if(pool is not None):
+            pool.terminate()
+        shutil.rmtree(directory, ignore_errors = True)
+
+
+#
+# Parallel version of process_tiled: workers read tiles from a shared memory-mapped copy of the input.
+# workers = 0 uses all CPU cores. function must be a module level function (picklable).
+# With pipeline set, finished tiles are written by a background thread while further results are collected.
+# With source_path set (e.g. the VRT of a mosaic), workers read their tiles from the raster file instead.
+#
+def process_tiled_parallel(band, outband, tile_size, halo, function, args, workers, pipeline = False, tiles = None, source_path = None):
+    if(workers == 0):
+        workers = multiprocessing.cpu_count()
+
+    if(tiles is None):
+        tiles = band_tiles(band, tile_size, halo)
+
+    directory = tempfile.mkdtemp(prefix = "rollingcoin_")
+    pool = None
+    try:
+        if(source_path is None):
+            path, dtype = band_to_memmap(band, directory, aligned_tile_size(band, tile_size)[1])
+            pool = multiprocessing.Pool(workers, init_worker, (path, dtype, (band.YSize, band.XSize), function, args))
+        else:
+            pool = multiprocessing.Pool(workers, init_raster_worker, (source_path, function, args))
+
+        if(pipeline == True):
+            write_pipelined(outband, pool.imap_unordered(process_worker_tile, tiles), workers)
+        else:
+            for write_window, result_array in pool.imap_unordered(process_worker_tile, tiles):
+                outband.WriteArray(result_array, write_window[0], write_window[1])
+
+        pool.close()
+        pool.join()
+        pool = None
+
+    finally:
+        if(pool is not None):
+            pool.terminate()
+        shutil.rmtree(directory, ignore_errors = True)
+
+    outband.FlushCache()
+    return
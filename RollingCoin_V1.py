@@ -8,10 +8,19 @@
 #   1. Go/NoGo areas (Shoals) (not exported)
 #   2. Expanded shoals (buffered/expanded 1 cell in all directions) (not exported)
 #   3. "Rolling Coin" generalized contour limit surface (exported)
+#   4. Depth contours of the production levels (exported, ESRI Shapefile)
 
 # Depends on:
 # 1. GDAL (see http://www.gdal.org/)
 # 2. NumPy (see http://www.numpy.org/)
+# 3. RollingCoin_Tiles.py (tiled processing)
+# 4. RollingCoin_Report.py (run report)
+# 5. RollingCoin_Blocks.py (NoData block index)
+# 6. RollingCoin_Incremental.py (incremental updates)
+# 7. RollingCoin_Cache.py (result cache)
+# 8. RollingCoin_Output.py (output profiles)
+# 9. RollingCoin_Mosaic.py (mosaic inputs)
+# 10. RollingCoin_Filters.py (coin focal filters)
 
 # # # # # # # # #
 #   Imports:    #
@@ -20,10 +29,20 @@
 try:
     import os
     import time
+    import shutil
+    import tempfile
     import numpy
     import math
-    from osgeo import gdal, osr
+    from osgeo import gdal, osr, ogr
     from gdalconst import *
+    import RollingCoin_Tiles
+    import RollingCoin_Report
+    import RollingCoin_Blocks
+    import RollingCoin_Incremental
+    import RollingCoin_Cache
+    import RollingCoin_Output
+    import RollingCoin_Mosaic
+    import RollingCoin_Filters
 
 except Exception:
     print "Dependencies not installed? Make sure GDAL and NumPy are installed. Exiting."
@@ -174,6 +193,19 @@ def create_coin(radius):
     return ret[1:-1, 1:-1] # Cut out outer edges: makes generalized contour limits smoother and processing more efficient
 
 
+# Coins created so far (see cached_coin):
+coin_cache = {}
+
+
+#
+# Returns the coin of a radius, created once per process. The returned coin is shared: do not modify it.
+#
+def cached_coin(radius):
+    if(radius not in coin_cache):
+        coin_cache[radius] = create_coin(radius)
+    return coin_cache[radius]
+
+
 #
 # Returns either TRUE or FALSE, depending on the cells tested
 # Cell to be tested is always in the middle of the coin.
@@ -237,112 +269,1293 @@ def roll_coin(src_array, dest_array, coin, radius, nodata, valdco):
         return False
 
 
+#
+# Whole-array version of array_to_binaryarray.
+# Shoal = 0, Safe = 1. Data type is 16-bit integer.
+#
+def array_to_binaryarray_numpy(src_array, depth_limit, nodata, new_nodata):
+    dest_array = numpy.ones((src_array.shape[0], src_array.shape[1]), dtype = numpy.int16, order = "C")
+    dest_array[src_array > depth_limit] = 0         # Shoal --> 0
+    dest_array[src_array == nodata] = new_nodata    # NoData -values
+
+    return dest_array # Cell values either 0 (shoal), 1 (safe) or new_nodata
+
+
+#
+# Whole-array version of buffer_shoals: 3 x 3 dilation of the shoal cells (array edges clipped).
+#
+def buffer_shoals_numpy(src_array, new_nodata):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    # Shoal mask padded with one "not shoal" cell on each side (clips the 3 x 3 window on edges):
+    shoal = numpy.zeros((rows + 2, columns + 2), dtype = numpy.bool_)
+    shoal[1:-1, 1:-1] = src_array == 0
+
+    # Any shoal in 3 x 3 neighborhood:
+    expanded = numpy.zeros((rows, columns), dtype = numpy.bool_)
+    for row_shift in range(3):
+        for col_shift in range(3):
+            expanded |= shoal[row_shift : row_shift + rows, col_shift : col_shift + columns]
+
+    dest_array = numpy.where(expanded, 0, 1).astype(numpy.int16)
+
+    # Restore original NoData after buffering:
+    dest_array[src_array == new_nodata] = new_nodata
+
+    return dest_array
+
+
+#
+# Whole-array version of check_coin: TRUE where the coin centered on the cell has no shoal cells.
+#
+# MISSING: Same edge behaviour as check_coin - cells closer than radius to the array edge are always FALSE.
+#
+def check_coin_numpy(coin, radius, array):
+    rows = array.shape[0]
+    columns = array.shape[1]
+
+    isclean = numpy.zeros((rows, columns), dtype = numpy.bool_)
+
+    inner_rows = rows - 2 * radius          # Number of coin centers inside array (rows)
+    inner_columns = columns - 2 * radius    # Number of coin centers inside array (columns)
+    if(inner_rows <= 0 or inner_columns <= 0):
+        return isclean                      # Coin never fits
+
+    # Erosion of the "not shoal" cells with the coin:
+    inner_clean = RollingCoin_Filters.coin_filter(array != 0, RollingCoin_Filters.coin_footprint(coin, radius), numpy.minimum)
+
+    if(inner_clean is None):
+        inner_clean = True                  # Empty coin is always clean
+    isclean[radius : radius + inner_rows, radius : radius + inner_columns] = inner_clean
+    return isclean
+
+
+#
+# Whole-array version of roll_coin: clean coin centers are dilated with the coin to find the cells to write.
+#
+def roll_coin_numpy(src_array, dest_array, coin, radius, nodata, valdco):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    try:
+        # Coin centers: not shoal, not NoData and coin clean:
+        isclean = check_coin_numpy(coin, radius, src_array)
+        isclean &= src_array != 0
+        isclean &= src_array != nodata
+
+        inner_rows = rows - 2 * radius
+        inner_columns = columns - 2 * radius
+
+        if(inner_rows > 0 and inner_columns > 0):
+            inner_clean = isclean[radius : radius + inner_rows, radius : radius + inner_columns]
+
+            # Dilation of the clean coin centers with the coin:
+            oncoin = RollingCoin_Filters.coin_spread(inner_clean, RollingCoin_Filters.coin_footprint(coin, radius), numpy.maximum)
+
+            dest_array[oncoin] = valdco
+
+        # Restore original nodata:
+        dest_array[src_array == nodata] = nodata
+
+        return True
+
+    except Exception:
+        return False
+
+
+#
+# Builds a shoal index of a (buffered) array: per-row prefix sums of shoal cells (rows x columns + 1) and the coin chords.
+#
+def create_shoal_index(array, coin, radius):
+    rows = array.shape[0]
+    columns = array.shape[1]
+
+    index = numpy.zeros((rows, columns + 1), dtype = numpy.int32)
+    numpy.cumsum(array == 0, axis = 1, out = index[:, 1:])
+
+    chords = [(row - radius, col - radius, width) for row, col, width in RollingCoin_Filters.coin_chords(RollingCoin_Filters.coin_footprint(coin, radius))]
+    return index, chords
+
+
+#
+# Same as check_coin, but uses a shoal index: one subtraction per coin chord instead of a scan of every coin cell.
+#
+# MISSING: Corners, top & bottom rows and extreme columns (same edge behaviour as check_coin).
+#
+def check_coin_index(shoal_index, radius, index_row, index_col, rows, columns):
+    index, chords = shoal_index
+    if(index_row >= radius and index_row <= (rows-radius-1) and index_col >= radius and index_col <= (columns-radius-1)): # Inside array:
+        for row_coin, col_coin, width in chords:
+            row = index[index_row + row_coin]
+            if(row[index_col + col_coin + width] != row[index_col + col_coin]): # Shoal cells on chord -> return false
+                return False
+        return True
+    else:
+        return False
+
+
+#
+# Rolls the coin cell by cell like roll_coin, using a shoal index for the coin checks and chord slices for the writes.
+#
+def roll_coin_index(src_array, dest_array, coin, radius, nodata, valdco):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    try:
+        shoal_index = create_shoal_index(src_array, coin, radius)
+        chords = shoal_index[1]
+
+        # Coin centers: not shoal and not NoData
+        centers = (src_array != 0) & (src_array != nodata)
+
+        for i, j in zip(*numpy.nonzero(centers)):
+            if(check_coin_index(shoal_index, radius, i, j, rows, columns) == True):
+                for row_coin, col_coin, width in chords:
+                    dest_array[i + row_coin, j + col_coin : j + col_coin + width] = valdco
+
+        # Restore original nodata:
+        dest_array[src_array == nodata] = nodata
+
+        return True
+
+    except Exception:
+        return False
+
+
+#
+# Returns a boolean array: TRUE where a TRUE cell of mask is within reach cells (square neighborhood, edges clipped).
+#
+def near_mask(mask, reach):
+    rows = mask.shape[0]
+    columns = mask.shape[1]
+
+    padded = numpy.zeros((rows, columns + 2 * reach), dtype = numpy.bool_)
+    padded[:, reach : reach + columns] = mask
+    near_rows = RollingCoin_Filters.sliding_filter(padded, 2 * reach + 1, numpy.maximum, False)
+
+    padded = numpy.zeros((columns, rows + 2 * reach), dtype = numpy.bool_)
+    padded[:, reach : reach + rows] = near_rows.T
+    return RollingCoin_Filters.sliding_filter(padded, 2 * reach + 1, numpy.maximum, False).T
+
+
+#
+# Narrow band version of roll_coin: safe cells with no shoals within 2 * radius get valdco in bulk, the coin is
+# tested only in the band near shoals. Bands wider than a tenth of the array are rolled with roll_coin_numpy.
+#
+def roll_coin_band(src_array, dest_array, coin, radius, nodata, valdco):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    try:
+        footprint = RollingCoin_Filters.coin_footprint(coin, radius)
+        if(footprint.shape[0] < 2 * radius + 1 or footprint.shape[1] < 2 * radius + 1 or footprint[radius, radius] == False):
+            return roll_coin_numpy(src_array, dest_array, coin, radius, nodata, valdco) # Coin does not cover its center
+
+        # Coin centers: not shoal, not NoData and far enough from array edges:
+        safe = (src_array != 0) & (src_array != nodata)
+        inside = numpy.zeros((rows, columns), dtype = numpy.bool_)
+        inside[radius : rows - radius, radius : columns - radius] = True
+
+        # Bulk: no shoal within 2 * radius -> clean coin center covering itself:
+        bulk = safe & inside & ~near_mask(src_array == 0, 2 * radius)
+        dest_array[bulk] = valdco
+
+        # Narrow band: safe cells that need the coin test:
+        band = safe & ~bulk
+
+        # Wide band (shoal-rich areas): whole-array engine is faster, same output
+        if(numpy.count_nonzero(band) > band.size // 10):
+            return roll_coin_numpy(src_array, dest_array, coin, radius, nodata, valdco)
+
+        # Clean coin centers (bulk centers are clean, band centers are checked chord by chord).
+        # Shoal index is read with flat indexes: one offset per chord.
+        index, chords = create_shoal_index(src_array, coin, radius)
+        flat_index = index.ravel()
+        centers = numpy.flatnonzero(band & inside)
+        center_base = centers // columns * (columns + 1) + centers % columns
+        clean_centers = numpy.ones(centers.shape[0], dtype = numpy.bool_)
+        for row_coin, col_coin, width in chords:
+            first = center_base + (row_coin * (columns + 1) + col_coin)
+            clean_centers &= flat_index.take(first + width) == flat_index.take(first)
+        del index, flat_index, center_base
+
+        # Clean coin centers padded by radius cells (coin writes never fall outside the padded array):
+        clean = numpy.zeros((rows + 2 * radius, columns + 2 * radius), dtype = numpy.bool_)
+        clean[radius : radius + rows, radius : radius + columns] = bulk
+        clean_rows = centers[clean_centers] // columns + radius
+        clean[clean_rows, centers[clean_centers] % columns + radius] = True
+        del centers, clean_centers, clean_rows
+
+        # Prefix sums of clean coin centers, then band cells covered by any clean coin:
+        padded_columns = columns + 2 * radius + 1
+        center_index = numpy.zeros((rows + 2 * radius, padded_columns), dtype = numpy.int32)
+        numpy.cumsum(clean, axis = 1, out = center_index[:, 1:])
+        del clean
+        flat_index = center_index.ravel()
+
+        band_cells = numpy.flatnonzero(band)
+        band_base = (band_cells // columns + radius) * padded_columns + band_cells % columns + radius
+        covered = numpy.zeros(band_cells.shape[0], dtype = numpy.bool_)
+        for row_coin, col_coin, width in chords:
+            last = band_base - (row_coin * padded_columns + col_coin - 1)
+            covered |= flat_index.take(last) > flat_index.take(last - width)
+
+        dest_array.flat[band_cells[covered]] = valdco
+
+        # Restore original nodata:
+        dest_array[src_array == nodata] = nodata
+
+        return True
+
+    except Exception:
+        return False
+
+
+#
+# Bit-packed masks of the "packed" engine: 8 cells per byte along rows (numpy.packbits), bits beyond the last column 0.
+#
+
+#
+# Returns the bit-packed mask of ufunc(array, value) (e.g. numpy.greater), built in strips of strip_rows rows.
+#
+def packed_compare(array, ufunc, value, strip_rows = 1024):
+    packed = numpy.zeros((array.shape[0], -(-array.shape[1] // 8)), dtype = numpy.uint8)
+    for row in range(0, array.shape[0], strip_rows):
+        packed[row : row + strip_rows] = numpy.packbits(ufunc(array[row : row + strip_rows], value), axis = 1)
+    return packed
+
+
+#
+# Returns a bit-packed mask shifted along rows: result bit x = mask bit x + shift (0 outside the mask).
+#
+def shift_packed_columns(packed, columns, shift):
+    byte_shift, bit_shift = divmod(shift, 8)
+    size = packed.shape[1]
+    pad = abs(byte_shift) + 1
+
+    padded = numpy.zeros((packed.shape[0], size + 2 * pad), dtype = numpy.uint8)
+    padded[:, pad : pad + size] = packed
+    result = padded[:, pad + byte_shift : pad + byte_shift + size] << bit_shift
+    if(bit_shift > 0):
+        result |= padded[:, pad + byte_shift + 1 : pad + byte_shift + 1 + size] >> (8 - bit_shift)
+
+    # Clear bits beyond the last column:
+    if(columns % 8 != 0):
+        result[:, -1] &= (0xFF << (8 - columns % 8)) & 0xFF
+    return result
+
+
+#
+# Returns a bit-packed mask shifted along columns: result row y = mask row y + shift (0 outside the mask).
+#
+def shift_packed_rows(packed, shift):
+    rows = packed.shape[0]
+    result = numpy.zeros_like(packed)
+    if(abs(shift) < rows):
+        if(shift >= 0):
+            result[: rows - shift] = packed[shift :]
+        else:
+            result[-shift :] = packed[: rows + shift]
+    return result
+
+
+#
+# Sliding OR along rows of a bit-packed mask (doubling shifts): result bit x = any of mask bits x .. x + width - 1.
+#
+def sliding_packed_or(packed, columns, width):
+    result = packed
+    covered = 1
+    while(covered * 2 <= width):
+        result = result | shift_packed_columns(result, columns, covered)
+        covered *= 2
+    if(covered < width):
+        result = result | shift_packed_columns(result, columns, width - covered)
+    return result
+
+
+#
+# Bit-packed version of buffer_shoals_numpy: 3 x 3 dilation of a packed shoal mask (array edges clipped).
+#
+def dilate_packed(packed, columns):
+    expanded = packed | shift_packed_columns(packed, columns, 1) | shift_packed_columns(packed, columns, -1)
+    return expanded | shift_packed_rows(expanded, 1) | shift_packed_rows(expanded, -1)
+
+
+#
+# Bit-packed coin erosion: returns the packed mask of coin centers with no set cell of packed under the coin
+# (edges like in check_coin).
+#
+def check_coin_packed(packed, columns, footprint, radius):
+    rows = packed.shape[0]
+    chords = RollingCoin_Filters.coin_chords(footprint)
+    covered = numpy.zeros_like(packed)
+
+    for width in sorted(set([chord[2] for chord in chords])):
+        window = sliding_packed_or(packed, columns, width)  # Shared by all chords of this width
+        for row, col, chord_width in chords:
+            if(chord_width == width):
+                covered |= shift_packed_rows(shift_packed_columns(window, columns, col - radius), row - radius)
+
+    # Coin centers inside the array:
+    inner_columns = numpy.zeros((1, columns), dtype = numpy.bool_)
+    inner_columns[0, radius : columns - radius] = True
+    inner = numpy.zeros_like(packed)
+    inner[radius : rows - radius] = numpy.packbits(inner_columns, axis = 1)
+    return inner & ~covered
+
+
+#
+# Bit-packed coin dilation: returns the packed mask of cells covered by a coin centered on any set cell of packed.
+#
+def spread_coin_packed(packed, columns, footprint, radius):
+    chords = RollingCoin_Filters.coin_chords(footprint)
+
+    # Coins reach up to 2 * radius cells over the array edges: shift in a mask padded by whole bytes on both sides
+    pad = -(-(2 * radius + 1) // 8)
+    size = packed.shape[1]
+    padded_columns = (size + 2 * pad) * 8
+    padded = numpy.zeros((packed.shape[0], size + 2 * pad), dtype = numpy.uint8)
+    padded[:, pad : pad + size] = packed
+    spread = numpy.zeros_like(padded)
+
+    for width in sorted(set([chord[2] for chord in chords])):
+        window = sliding_packed_or(padded, padded_columns, width)   # Shared by all chords of this width
+        for row, col, chord_width in chords:
+            if(chord_width == width):
+                spread |= shift_packed_rows(shift_packed_columns(window, padded_columns, radius - col - width + 1), radius - row)
+
+    spread = spread[:, pad : pad + size]
+    if(columns % 8 != 0):
+        spread[:, -1] &= (0xFF << (8 - columns % 8)) & 0xFF     # Clear bits beyond the last column
+    return spread
+
+
+#
+# Bit-packed version of roll_coin: buffered and nodata_mask are packed masks, dest_array is written in strips.
+#
+def roll_coin_packed(buffered, nodata_mask, dest_array, coin, radius, columns, nodata, valdco, strip_rows = 1024):
+    try:
+        # Coin centers: not shoal, not NoData and coin clean:
+        clean = check_coin_packed(buffered, columns, RollingCoin_Filters.coin_footprint(coin, radius), radius)
+        clean &= ~buffered
+        clean &= ~nodata_mask
+
+        oncoin = spread_coin_packed(clean, columns, RollingCoin_Filters.coin_footprint(coin, radius), radius)
+        del clean
+
+        write_packed(dest_array, oncoin, nodata_mask, columns, nodata, valdco, strip_rows)
+        return True
+
+    except Exception:
+        return False
+
+
+#
+# Writes valdco to the cells of the packed mask oncoin and nodata to the cells of the packed NoData mask.
+#
+def write_packed(dest_array, oncoin, nodata_mask, columns, nodata, valdco, strip_rows = 1024):
+    for row in range(0, dest_array.shape[0], strip_rows):
+        strip = dest_array[row : row + strip_rows]
+        strip[numpy.unpackbits(oncoin[row : row + strip_rows], axis = 1)[:, :columns].view(numpy.bool_)] = valdco
+
+        # Restore original nodata:
+        strip[numpy.unpackbits(nodata_mask[row : row + strip_rows], axis = 1)[:, :columns].view(numpy.bool_)] = nodata
+
+
+#
+# Returns TRUE if the depth limits of the (valdco, depth_limit) level list get strictly deeper level by level
+# (safe areas are nested).
+#
+def levels_nested(levels):
+    for k in range(1, len(levels)):
+        if(levels[k][1] >= levels[k - 1][1]):
+            return False
+    return True
+
+
+#
+# Rolls the coin for all (valdco, depth_limit) levels in one pass: min / max filters of a level index
+# (number of levels the cell is safe for). Levels that are not nested are processed level by level.
+#
+def roll_coin_levels(src_array, dest_array, coin, radius, nodata, new_nodata, levels):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    if(len(levels) == 0):
+        return True
+
+    if(levels_nested(levels) == False):
+        for valdco, deplim in levels:
+            byte_array = array_to_binaryarray_numpy(src_array, deplim, nodata, new_nodata)
+            buffered_array = buffer_shoals_numpy(byte_array, new_nodata)
+            if(roll_coin_numpy(buffered_array, dest_array, coin, radius, new_nodata, valdco) == False):
+                return False
+        return True
+
+    try:
+        level_count = len(levels)
+        index_type = numpy.uint8 if level_count < 255 else numpy.uint16
+
+        # 1. Level index: number of levels the cell is safe for (NoData is never shoal):
+        nodata_mask = src_array == nodata
+        level_index = numpy.zeros((rows, columns), dtype = index_type)
+        for valdco, deplim in levels:
+            level_index += ~(src_array > deplim)
+        level_index[nodata_mask] = level_count
+
+        # 2. Buffer shoals: 3 x 3 min filter (array edges clipped):
+        padded = numpy.full((rows + 2, columns + 2), level_count, dtype = index_type)
+        padded[1:-1, 1:-1] = level_index
+        buffered_index = level_index.copy()
+        for row_shift in range(3):
+            for col_shift in range(3):
+                numpy.minimum(buffered_index, padded[row_shift : row_shift + rows, col_shift : col_shift + columns], out = buffered_index)
+        buffered_index[nodata_mask] = level_count
+        del padded
+
+        inner_rows = rows - 2 * radius
+        inner_columns = columns - 2 * radius
+
+        if(inner_rows > 0 and inner_columns > 0):
+            footprint = RollingCoin_Filters.coin_footprint(coin, radius)
+
+            # 3. Check coin: deepest level the coin is clean for (min filter with the coin, center cell included):
+            inner_clean = buffered_index[radius : radius + inner_rows, radius : radius + inner_columns].copy()
+            coin_clean = RollingCoin_Filters.coin_filter(buffered_index, footprint, numpy.minimum)
+            if(coin_clean is not None):
+                numpy.minimum(inner_clean, coin_clean, out = inner_clean)
+                del coin_clean
+            inner_clean[nodata_mask[radius : radius + inner_rows, radius : radius + inner_columns]] = 0 # NoData is never a coin center
+
+            # 4. Write coin: deepest clean level on any coin covering the cell (max filter with the coin):
+            oncoin = RollingCoin_Filters.coin_spread(inner_clean, footprint, numpy.maximum)
+
+            # Deeper levels overwrite shallower ones:
+            valdcos = numpy.array([0] + [valdco for valdco, deplim in levels], dtype = dest_array.dtype)
+            written = oncoin > 0
+            dest_array[written] = valdcos[oncoin[written]]
+
+        # Restore original nodata:
+        dest_array[nodata_mask] = new_nodata
+
+        return True
+
+    except Exception:
+        return False
+
+
+# Largest distance limit (cells) of the direct window row pass in squared_distance_transform:
+window_reach = 128
+
+
+#
+# Returns the squared Euclidean distance (cells, 32-bit float) to the nearest TRUE cell of mask: column pass, then row pass.
+# With limit (cells) set, only distances up to limit are exact. Both passes run in strips of at most strip_cells cells.
+#
+def squared_distance_transform(mask, limit = None, strip_cells = 1048576):
+    rows = mask.shape[0]
+    columns = mask.shape[1]
+    far = rows + columns                    # Farther than any cell in the array
+    if(limit is not None):
+        far = min(far, int(math.floor(limit)) + 1)
+
+    # 1. Distance to nearest TRUE cell in the same column (nearest above and nearest below), in column strips:
+    distance = numpy.empty((rows, columns), dtype = numpy.float32)
+    row_index = numpy.arange(rows, dtype = numpy.int32).reshape(rows, 1)
+    strip_columns = max(1, strip_cells // rows)
+    for left in range(0, columns, strip_columns):
+        strip = mask[:, left : left + strip_columns]
+        above = numpy.maximum.accumulate(numpy.where(strip, row_index, -(rows + columns)), axis = 0)
+        below = numpy.minimum.accumulate(numpy.where(strip, row_index, 2 * (rows + columns))[::-1], axis = 0)[::-1]
+        column_distance = numpy.minimum(numpy.minimum(row_index - above, below - row_index), far).astype(numpy.float32)
+        distance[:, left : left + strip_columns] = column_distance ** 2
+
+    # 2. Minimum of (col - q)^2 + column distance^2 along rows, in row strips (short limits: direct window minimum):
+    strip_rows = max(1, strip_cells // columns)
+    for top in range(0, rows, strip_rows):
+        if(far <= window_reach):
+            window_envelope(distance[top : top + strip_rows], far)
+        else:
+            parabola_envelope(distance[top : top + strip_rows])
+
+    return distance
+
+
+#
+# Row pass of squared_distance_transform for limits up to window_reach: window minimum of f[col] + (col - q)^2.
+#
+def window_envelope(f, reach):
+    values = f.copy()
+    for shift in range(1, min(reach, f.shape[1])):
+        numpy.minimum(f[:, shift:], values[:, :-shift] + shift * shift, out = f[:, shift:])
+        numpy.minimum(f[:, :-shift], values[:, shift:] + shift * shift, out = f[:, :-shift])
+    return
+
+
+#
+# Row pass of squared_distance_transform: lower envelope of parabolas along each row (Felzenszwalb & Huttenlocher).
+#
+def parabola_envelope(f):
+    rows = f.shape[0]
+    columns = f.shape[1]
+    values = f.astype(numpy.float64)
+    row_ids = numpy.arange(rows)
+    vertex = numpy.zeros((rows, columns), dtype = numpy.int32)       # Parabola vertices of the envelope
+    bound = numpy.zeros((rows, columns + 1), dtype = numpy.float64)  # Ranges of the envelope parabolas
+    k = numpy.zeros(rows, dtype = numpy.int32)                       # Number of envelope parabolas - 1
+    bound[:, 0] = -numpy.inf
+    bound[:, 1] = numpy.inf
+
+    for q in range(1, columns):
+        active = row_ids
+        while(active.size > 0):
+            v = vertex[active, k[active]]
+            s = ((values[active, q] + q * q) - (values[active, v] + v.astype(numpy.float64) ** 2)) / (2.0 * (q - v))
+            popped = s <= bound[active, k[active]]
+            k[active[popped]] -= 1              # Parabola hidden by parabola q
+            done = active[~popped]
+            k[done] += 1
+            vertex[done, k[done]] = q
+            bound[done, k[done]] = s[~popped]
+            bound[done, k[done] + 1] = numpy.inf
+            active = active[popped]
+
+    k[:] = 0
+    for q in range(columns):
+        moving = bound[row_ids, k + 1] < q
+        while(moving.any()):
+            k[moving] += 1
+            moving = bound[row_ids, k + 1] < q
+        v = vertex[row_ids, k]
+        f[:, q] = (q - v.astype(numpy.float64)) ** 2 + values[row_ids, v]
+
+    return
+
+
+#
+# Creates and returns the round coin of roll_coin_edt: cells with center distance <= radius (cells, fractional).
+#
+def create_edt_coin(radius):
+    reach = int(math.floor(radius))
+    y, x = numpy.mgrid[-reach : reach + 1, -reach : reach + 1]
+    return x**2 + y**2 <= radius**2
+
+
+#
+# Returns the number of cells that differ between a create_coin coin and the distance transform coin of radius.
+#
+def check_edt_coin(coin, radius):
+    edt_coin = create_edt_coin(radius)
+    size = max(coin.shape[0], edt_coin.shape[0])
+    padded_coin = numpy.zeros((size, size), dtype = numpy.bool_)
+    padded_edt = numpy.zeros((size, size), dtype = numpy.bool_)
+    offset = (size - coin.shape[0]) // 2
+    padded_coin[offset : offset + coin.shape[0], offset : offset + coin.shape[1]] = coin
+    offset = (size - edt_coin.shape[0]) // 2
+    padded_edt[offset : offset + edt_coin.shape[0], offset : offset + edt_coin.shape[1]] = edt_coin
+    return int(numpy.count_nonzero(padded_coin != padded_edt))
+
+
+#
+# Distance transform version of roll_coin with create_edt_coin(radius): round coin of any (fractional) radius.
+#
+# MISSING: Same edge behaviour as check_coin - coin centers closer than radius to the array edge are not tested.
+#
+def roll_coin_edt(src_array, dest_array, radius, nodata, valdco):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+    reach = int(math.floor(radius))
+
+    try:
+        # Coin centers: not shoal, not NoData and no shoal cell within radius:
+        isclean = squared_distance_transform(src_array == 0, radius) > radius**2
+        isclean &= src_array != 0
+        isclean &= src_array != nodata
+
+        # Edge cells are never coin centers:
+        isclean[:reach, :] = False
+        isclean[rows - reach:, :] = False
+        isclean[:, :reach] = False
+        isclean[:, columns - reach:] = False
+
+        # Write valdco within radius of coin centers:
+        if(isclean.any()):
+            oncoin = squared_distance_transform(isclean, radius) <= radius**2
+            dest_array[oncoin] = valdco
+
+        # Restore original nodata:
+        dest_array[src_array == nodata] = nodata
+
+        return True
+
+    except Exception:
+        return False
+
+
+#
+# Compares roll_coin_edt with the coin footprint engines on one buffered array: run times and differing cells.
+# brute_force = True also times the reference roll_coin loops (slow, use small arrays).
+#
+def compare_edt(buffered_array, radius, nodata, valdco, brute_force = False):
+    coin = create_edt_coin(radius)
+    reach = int(math.floor(radius))
+    report = {}
+
+    start = time.time()
+    edt_array = numpy.zeros((buffered_array.shape[0], buffered_array.shape[1]), dtype = numpy.int16)
+    roll_coin_edt(buffered_array, edt_array, radius, nodata, valdco)
+    report["edt"] = time.time() - start
+
+    engines = [("numpy", roll_coin_numpy)]
+    if(brute_force == True):
+        engines.append(("loop", roll_coin))
+
+    for name, function in engines:
+        start = time.time()
+        coin_array = numpy.zeros((buffered_array.shape[0], buffered_array.shape[1]), dtype = numpy.int16)
+        function(buffered_array, coin_array, coin, reach, nodata, valdco)
+        report[name] = time.time() - start
+        report[name + "_speedup"] = report[name] / max(report["edt"], 1e-9)
+        report[name + "_differences"] = int(numpy.count_nonzero(coin_array != edt_array))
+        print "  EDT vs", name + ": speedup", str(round(report[name + "_speedup"], 1)) + "x,", report[name + "_differences"], "cells differ"
+
+    return report
+
+
+#
+# Creates the contour limit surface of a depth model array for the given (valdco, depth_limit) levels.
+# Returns the contour limit array (16-bit integer) or None if coin rolling fails.
+# With engine = "edt" the coin is round and radius can be fractional (cells).
+# With array_cache set (RollingCoin_Cache.array_cache_settings), the contour limits are cached by depths and coin.
+#
+def create_contour_limits(data_array, nodata, nodata_new, coin, radius, levels, engine, verbose = False, report = None, array_cache = None):
+    # Cached contour limits (engines give the same result, except the round coin of "edt"):
+    if(array_cache is not None):
+        key_parts = (data_array, nodata, nodata_new, coin, radius, levels, engine == "edt")
+        return RollingCoin_Cache.cached_array(array_cache, "V1 contour limits", key_parts, create_contour_limits,
+                                              (data_array, nodata, nodata_new, coin, radius, levels, engine, verbose, report))
+
+    # Create new array to hold all contour limits:
+    dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), 0, dtype = numpy.int16, order = "C")
+
+    # All contour levels in one pass:
+    if(engine == "multilevel"):
+        if(verbose == True):
+            print "\nGenerating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours in one pass.."
+        with RollingCoin_Report.stage(report, "roll_coin_levels") as record:
+            record["levels"] = [valdco for valdco, deplim in levels]
+            if(roll_coin_levels(data_array, dest_array, coin, radius, nodata, nodata_new, levels) == False):
+                return None
+        return dest_array
+
+    # Bit-packed masks, NoData mask shared by all contour levels:
+    if(engine == "packed"):
+        columns = data_array.shape[1]
+        if(nodata is None):
+            nodata_mask = numpy.zeros((data_array.shape[0], -(-columns // 8)), dtype = numpy.uint8)
+        else:
+            nodata_mask = packed_compare(data_array, numpy.equal, nodata)
+
+        for valdco, deplim in levels:
+            if(verbose == True):
+                print "\nGenerating contour limits for", valdco, "m contour (bit-packed masks).."
+            with RollingCoin_Report.stage(report, "binary_array", valdco):
+                shoal_mask = packed_compare(data_array, numpy.greater, deplim) & ~nodata_mask
+            with RollingCoin_Report.stage(report, "buffer_shoals", valdco):
+                buffered_mask = dilate_packed(shoal_mask, columns) & ~nodata_mask
+                del shoal_mask
+            with RollingCoin_Report.stage(report, "roll_coin", valdco):
+                if(roll_coin_packed(buffered_mask, nodata_mask, dest_array, coin, radius, columns, nodata_new, valdco) == False):
+                    return None
+        return dest_array
+
+    for valdco, deplim in levels:
+        # Generate depth limits:
+        if(verbose == True):
+            print "\nGenerating contour limits for", valdco, "m contour:"
+
+        # Create/update "binary array":
+        if(verbose == True):
+            print "  1. Creating GO/NOGO array.."
+        with RollingCoin_Report.stage(report, "binary_array", valdco):
+            if(engine == "loop"):
+                byte_array = array_to_binaryarray(data_array, deplim, nodata, nodata_new)
+            else:
+                byte_array = array_to_binaryarray_numpy(data_array, deplim, nodata, nodata_new)
+
+        # Buffer shoals create/update:
+        if(verbose == True):
+            print "  2. Expanding shoals to ensure contour safety.."
+        with RollingCoin_Report.stage(report, "buffer_shoals", valdco):
+            if(engine == "loop"):
+                buffered_array = buffer_shoals(byte_array, nodata_new)
+            else:
+                buffered_array = buffer_shoals_numpy(byte_array, nodata_new)
+
+        # Generalize surface using rolling coin:
+        if(verbose == True):
+            print "  3. Rolling coin.."
+        with RollingCoin_Report.stage(report, "roll_coin", valdco) as record:
+            if(report is not None):
+                record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(buffered_array, nodata_new)
+            if(engine == "edt"):
+                success = roll_coin_edt(buffered_array, dest_array, radius, nodata_new, valdco)
+            elif(engine == "index"):
+                success = roll_coin_index(buffered_array, dest_array, coin, radius, nodata_new, valdco)
+            elif(engine == "band"):
+                success = roll_coin_band(buffered_array, dest_array, coin, radius, nodata_new, valdco)
+            elif(engine == "numpy"):
+                success = roll_coin_numpy(buffered_array, dest_array, coin, radius, nodata_new, valdco)
+            else:
+                success = roll_coin(buffered_array, dest_array, coin, radius, nodata_new, valdco)
+        if (success is False):
+            return None
+
+    return dest_array
+
+
+#
+# Returns the (valdco, depth_limit) levels of contour_list within the data depth range (min_max_depth from GDAL).
+#
+def contour_levels(contour_list, min_max_depth):
+    minimum_depth = min_max_depth[1]
+    maximum_depth = min_max_depth[0]
+
+    levels = []
+    for valdco in contour_list:
+        # Get true depth limit by valdco:
+        deplim = parseDepthLimit(valdco)
+
+        # Skip contours outside data depth range:
+        if (math.fabs(deplim) < math.fabs(minimum_depth) or math.fabs(deplim) > math.fabs(maximum_depth)):
+            continue
+
+        levels.append((valdco, deplim))
+
+    return levels
+
+
+#
+# Returns the radius passed to roll_coin: coin radius - 1, or the round coin radius in cells for engine = "edt".
+#
+def coin_roll_radius(engine, coin_radius, edt_radius, geotransform):
+    if(engine != "edt"):
+        return coin_radius - 1
+    if(edt_radius is None):
+        return float(coin_radius)
+    return edt_radius / math.fabs(geotransform[1]) # Map units to cells
+
+
+#
+# Tile function for RollingCoin_Tiles: create_contour_limits that raises an exception if coin rolling fails.
+#
+def create_tile_limits(tile_array, nodata, nodata_new, coin, radius, levels, engine, array_cache = None):
+    tile_limits = create_contour_limits(tile_array, nodata, nodata_new, coin, radius, levels, engine, array_cache = array_cache)
+    if (tile_limits is None):
+        raise Exception("Error in Coin Rolling.")
+    return tile_limits
+
+
+#
+# Task function for RollingCoin_Tiles.map_shared: rolls the coin for one contour level over the shared depth model.
+# Returns the bit-packed masks of the cells written with valdco and with NoData.
+#
+def create_level_masks(data_array, deplim, nodata, nodata_new, coin, radius, engine, index, block_size, halo, array_cache = None):
+    # Marker value 1 for the written cells (valdco itself can be 0 or equal to a previous level):
+    level_args = (nodata, nodata_new, coin, radius, [(1, deplim)], engine, array_cache)
+    if(index is None):
+        level_limits = create_tile_limits(data_array, *level_args)
+    else:
+        level_limits = RollingCoin_Blocks.process_blocks(data_array, index, block_size, halo, nodata_new, numpy.int16, create_tile_limits, level_args)
+    return packed_compare(level_limits, numpy.equal, 1), packed_compare(level_limits, numpy.equal, nodata_new)
+
+
+#
+# Parallel version of create_contour_limits: contour levels are rolled by a pool of workers (0 = all CPU cores)
+# and written in level order. With a NoData block index each level is processed block-wise.
+#
+def create_contour_limits_parallel(data_array, nodata, nodata_new, coin, radius, levels, engine, workers, index = None, block_size = None, halo = None,
+                                   verbose = False, report = None, array_cache = None):
+    # Create new array to hold all contour limits:
+    dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), 0, dtype = numpy.int16, order = "C")
+
+    if(verbose == True):
+        print "\nGenerating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours in parallel.."
+    with RollingCoin_Report.stage(report, "parallel_levels") as record:
+        record["levels"] = [valdco for valdco, deplim in levels]
+        results = RollingCoin_Tiles.map_shared(data_array, create_level_masks, (nodata, nodata_new, coin, radius, engine, index, block_size, halo, array_cache),
+                                               [deplim for valdco, deplim in levels], workers)
+        for k, (oncoin, nodata_mask) in enumerate(results):
+            write_packed(dest_array, oncoin, nodata_mask, data_array.shape[1], nodata_new, levels[k][0])
+
+    return dest_array
+
+
+#
+# Creates the contour limit surface of a whole depth model array, with block_size set only the blocks with data.
+# With level_workers set the contour levels are rolled in parallel (see create_contour_limits_parallel).
+# Returns the contour limit array or None if coin rolling fails.
+#
+def roll_contour_limits(data_array, nodata, nodata_new, coin, radius, levels, engine, block_size, level_workers = None, verbose = False, report = None,
+                        array_cache = None):
+    # No contour levels within the depth range: no contour limits (NoData is not restored, like create_contour_limits):
+    if(len(levels) == 0):
+        return numpy.zeros((data_array.shape[0], data_array.shape[1]), dtype = numpy.int16, order = "C")
+
+    if(block_size is None):
+        if(level_workers is None):
+            return create_contour_limits(data_array, nodata, nodata_new, coin, radius, levels, engine, verbose, report, array_cache)
+        return create_contour_limits_parallel(data_array, nodata, nodata_new, coin, radius, levels, engine, level_workers, verbose = verbose, report = report,
+                                              array_cache = array_cache)
+
+    # Index NoData blocks once, process only blocks with data:
+    with RollingCoin_Report.stage(report, "block_index") as record:
+        index = RollingCoin_Blocks.block_index(data_array, nodata, block_size)
+        record.update(RollingCoin_Blocks.block_statistics(index, block_size, data_array.shape[0], data_array.shape[1]))
+    if(verbose == True):
+        print "\nGenerating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours,", record["nodata_blocks"], "of", index.size, "blocks NoData.."
+
+    halo = RollingCoin_Tiles.tile_halo(int(math.floor(radius)))
+    if(level_workers is None):
+        return RollingCoin_Blocks.process_blocks(data_array, index, block_size, halo, nodata_new, numpy.int16, create_contour_limits,
+                                                 (nodata, nodata_new, coin, radius, levels, engine, False, report, array_cache))
+    return create_contour_limits_parallel(data_array, nodata, nodata_new, coin, radius, levels, engine, level_workers, index, block_size, halo, verbose, report,
+                                          array_cache)
+
+
+#
+# Generates vector contours of the given levels (VALDCO) from a contour limit band (GDAL ContourGenerate).
+# Writes an ESRI Shapefile (fields ID and VALDCO), an existing output file is replaced.
+#
+def create_contours(band, contourpath, valdcos, nodata, projection):
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    if(os.path.exists(contourpath)):
+        driver.DeleteDataSource(contourpath)
+
+    datasource = driver.CreateDataSource(contourpath)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+    layer = datasource.CreateLayer(os.path.splitext(os.path.basename(contourpath))[0], srs, ogr.wkbLineString)
+    layer.CreateField(ogr.FieldDefn("ID", ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn("VALDCO", ogr.OFTInteger))
+
+    # Fixed levels only (interval and base not used), ID field index 0, VALDCO field index 1:
+    gdal.ContourGenerate(band, 0, 0, valdcos, 1, nodata, layer, 0, 1)
+    feature_count = layer.GetFeatureCount()
+
+    datasource = None # Close and flush the vector file
+    return feature_count
+
+
+#
+# Returns the lookup table from contour limit values (0 .. nodata_new) to byte classes:
+# 0 = no contour limit, 1 .. n = contour levels (valdcos ascending), 255 = NoData.
+#
+def limit_classes(valdcos, nodata_new):
+    if(len(valdcos) > 254):
+        raise ValueError("Byte output supports up to 254 contour levels.")
+
+    class_table = numpy.zeros(nodata_new + 1, dtype = numpy.uint8)
+    for number, valdco in enumerate(sorted(valdcos)):
+        class_table[valdco] = number + 1
+    class_table[nodata_new] = 255
+    return class_table
+
+
+#
+# Writes a contour limit band as byte classes (see limit_classes) with a color table and category names (VALDCO).
+#
+def write_limit_classes(band, outband, valdcos, nodata_new, strip_rows = 512):
+    class_table = limit_classes(valdcos, nodata_new)
+    for yoff in range(0, band.YSize, strip_rows):
+        ysize = min(strip_rows, band.YSize - yoff)
+        outband.WriteArray(class_table[band.ReadAsArray(0, yoff, band.XSize, ysize)], 0, yoff)
+
+    colors = gdal.ColorTable()
+    names = [""] * 256
+    colors.SetColorEntry(0, (255, 255, 255, 255))
+    names[0] = "0"
+    for number, valdco in enumerate(sorted(valdcos)):
+        shade = int(200 * (1.0 - float(number + 1) / len(valdcos)))
+        colors.SetColorEntry(number + 1, (shade, shade + 30, 255, 255))
+        names[number + 1] = str(valdco)
+    colors.SetColorEntry(255, (0, 0, 0, 0))
+    names[255] = "NoData"
+
+    outband.SetColorTable(colors)
+    outband.SetCategoryNames(names)
+    outband.FlushCache()
+
+
 #
 # "Main method":
+# tile_size (cells): tile by tile processing (see RollingCoin_Tiles), workers: parallel tiles (0 = all CPU cores),
+# pipeline: background read / write threads. edt_radius: round coin radius of engine = "edt" in map units.
+# report_path / profile_stage: JSON run report / stage profiled with cProfile (see RollingCoin_Report).
+# block_size (cells): all NoData blocks are skipped (see RollingCoin_Blocks), None processes all cells.
+# output_profile: output raster format (see RollingCoin_Output), byte_output: byte classes (see limit_classes).
+# level_workers: contour levels in parallel (whole raster only). array_cache: see create_contour_limits.
+# path can also be a mosaic (see RollingCoin_Mosaic), output_tiles: directory of one output tile per source file.
 #
-def main(path, outpath, contourpath):
+def main(path, outpath, contourpath, engine = "numpy", contour_list = None, tile_size = None, workers = None, edt_radius = None, coin_radius = 10, report_path = None, profile_stage = None, block_size = 256,
+         pipeline = False, output_profile = "default", byte_output = False, level_workers = None, output_tiles = None, array_cache = None):
     # Get time stamp, start time:
     start_time = time.ctime() 
 
+    # Run report:
+    parameters = {"input": path, "engine": engine, "contour_list": contour_list, "tile_size": tile_size,
+                  "workers": workers, "edt_radius": edt_radius, "coin_radius": coin_radius, "block_size": block_size, "pipeline": pipeline,
+                  "output_profile": output_profile, "byte_output": byte_output, "level_workers": level_workers, "output_tiles": output_tiles}
+    report = RollingCoin_Report.create_report("RollingCoin_V1", parameters, profile_stage, report_path)
+
+    # Parallel processing is tiled:
+    if(workers is not None and tile_size is None):
+        tile_size = 1024
+
     # Define a nodata value for arrays:
     nodata_new = 15000 # "Deep enough"
 
     # Contour list (current FTA production contours):
-    contour_list = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500]
+    if(contour_list is None):
+        contour_list = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500]
 
 
     #
     # # Read in the data and get original nodata value and depth min/max:
     #
+    files = None
+    mosaic_path = None
+    mosaic_directory = None
     try:
-        data = gdal.Open(path, GA_ReadOnly)
-        band = data.GetRasterBand(1)
-        nodata = band.GetNoDataValue() # Get NoData value
-        min_max_depth = band.ComputeRasterMinMax(0) # Actual, all cells included
-        minimum_depth = min_max_depth[1]
-        maximum_depth = min_max_depth[0]
+        try:
+            with RollingCoin_Report.stage(report, "read") as record:
+                if(RollingCoin_Mosaic.is_mosaic(path)):
+                    # Source files through a VRT (no merged copy), processed by source tiles:
+                    mosaic_directory = tempfile.mkdtemp(prefix = "rollingcoin_")
+                    data, mosaic_path, files = RollingCoin_Mosaic.open_mosaic(path, mosaic_directory)
+                    record["source_files"] = len(files)
+                elif(output_tiles is not None):
+                    raise Exception("Output tiles need a mosaic input.")
+                else:
+                    data = gdal.Open(path, GA_ReadOnly)
+                band = data.GetRasterBand(1)
+                nodata = band.GetNoDataValue() # Get NoData value
+                min_max_depth = band.ComputeRasterMinMax(0) # Actual, all cells included
+                tiled = tile_size is not None or files is not None
+
+                # Create Numpy array from raster data (tiled processing reads tiles later):
+                if(tiled == False):
+                    data_array = numpy.array(data.GetRasterBand(1).ReadAsArray())
+                    if(report is not None):
+                        record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(data_array, nodata)
+                else:
+                    record["cells"] = band.XSize * band.YSize
+
+        except Exception:
+            print "Error reading the input data. Exiting."
+            exit()
+
+
+        #
+        # # Create Coin:
+        #
+        try:
+            # Default coin_radius = 10: Promising initial results using radius of 10 and 5m spatial resolution
+            coin = cached_coin(coin_radius)
+            roll_radius = coin_roll_radius(engine, coin_radius, edt_radius, data.GetGeoTransform())
+
+            # Distance transform engine: round coin of any radius
+            if(engine == "edt"):
+                print "\nDistance transform coin, radius =", roll_radius, "cells (" + str(check_edt_coin(coin, roll_radius)), "cells differ from create_coin coin)"
+        except Exception:
+            print "Error in Coin creation. Exiting."
+            exit()
+
+
+        #
+        # # Start rolling the coin:
+        #
+        try:
+            levels = contour_levels(contour_list, min_max_depth)
+
+            if(tiled == False):
+                dest_array = roll_contour_limits(data_array, nodata, nodata_new, coin, roll_radius, levels, engine, block_size, level_workers, True, report, array_cache)
+                if (dest_array is None):
+                    print "Error in Coin Rolling. Exiting."
+                    exit()
+
+        except Exception:
+            print "Error in depth limit surface calculation. Exiting."
+            exit()
+
+
+        #
+        # # Write contour limit raster using GDAL:
+        #
+        try:
+            print "\n\nExporting contour limits surface.."
+            with RollingCoin_Report.stage(report, "export" if tiled == False else "tiles") as record:
+                halo = RollingCoin_Tiles.tile_halo(int(math.floor(roll_radius)))
+                tiles = None
+                if(files is not None):
+                    tiles = RollingCoin_Mosaic.source_tiles(data, files, halo)
+
+                # COG and byte class outputs are copied from the contour limits after contouring:
+                copied_output = RollingCoin_Output.copied_profile(output_profile) or byte_output == True
+                if(output_tiles is None):
+                    work_path, work_profile = RollingCoin_Output.work_output(outpath, output_profile, tiled, copied_output)
+                    outdata = RollingCoin_Output.create_output(work_path, band.XSize, band.YSize, gdal.GDT_Int16, work_profile, data, nodata_new)
+                    outband = outdata.GetRasterBand(1)
+                    outputs = [(work_path, outpath)]
+                else:
+                    # One output tile per source file:
+                    tile_outpaths = RollingCoin_Mosaic.tile_paths(files, output_tiles)
+                    work_paths, outdata = RollingCoin_Mosaic.create_tile_outputs(files, tiles, tile_outpaths, gdal.GDT_Int16, output_profile, copied_output, nodata_new)
+                    work_profile = output_profile
+                    outband = outdata
+                    outputs = zip(work_paths, tile_outpaths)
+
+                if(tiled == False):
+                    outband.WriteArray(dest_array)
+                else:
+                    # Generate, roll and write contour limits tile by tile (read, roll and export in one stage):
+                    if(files is None):
+                        print "Generating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours in tiles of", tile_size, "cells.."
+                    else:
+                        print "Generating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours in", len(files), "source tiles.."
+                    record["levels"] = [valdco for valdco, deplim in levels]
+                    record["cells"] = band.XSize * band.YSize
+                    tile_args = (nodata, nodata_new, coin, roll_radius, levels, engine, array_cache)
+                    if(block_size is None or len(levels) == 0):   # Without contour levels NoData blocks are not NoData either
+                        RollingCoin_Tiles.process_tiled(band, outband, tile_size, halo, create_tile_limits, tile_args, workers, pipeline, tiles, mosaic_path)
+                    else:
+                        # Skip NoData blocks of each tile:
+                        RollingCoin_Tiles.process_tiled(band, outband, tile_size, halo, RollingCoin_Blocks.process_tile_blocks,
+                                                        (nodata, block_size, halo, nodata_new, numpy.int16, create_tile_limits, tile_args), workers, pipeline, tiles, mosaic_path)
+
+                if(work_profile != "memory"):
+                    outband = None
+                    outdata = None # Close dataset
+        except Exception, e:
+            print "Error exporting contour limit surface. Exiting.."
+            print e
+            exit()
+
+        #
+        # # Generate contours of the production levels in process:
+        #
+        contours_failed = False
+        try:
+            print "\nGenerating contours.."
+            with RollingCoin_Report.stage(report, "contour") as record:
+                if(tiled == False):
+                    # Contour the in-memory contour limits (no read back from disk):
+                    contour_data = gdal.GetDriverByName("MEM").Create("", band.XSize, band.YSize, 1, gdal.GDT_Int16)
+                    contour_data.SetGeoTransform(data.GetGeoTransform())
+                    contour_data.GetRasterBand(1).WriteArray(dest_array)
+                elif(output_tiles is None):
+                    contour_data = gdal.Open(work_path, GA_ReadOnly)
+                else:
+                    contour_data = RollingCoin_Mosaic.build_vrt([work_path for work_path, output_path in outputs]) # Output tiles as one raster
+
+                record["features"] = create_contours(contour_data.GetRasterBand(1), contourpath, [valdco for valdco, deplim in levels], nodata_new, data.GetProjection())
+                contour_data = None # Close dataset
+        except Exception, e:
+            print "Error generating contours. Contour shapefile not generated."
+            print e
+            contours_failed = True
+
+        #
+        # # Write COG / byte class output:
+        #
+        if(copied_output == True):
+            try:
+                print "\nWriting output raster.."
+                with RollingCoin_Report.stage(report, "output"):
+                    for work_path, output_path in outputs:
+                        if(work_profile != "memory"):
+                            outdata = gdal.Open(work_path, GA_ReadOnly)
+
+                        if(byte_output == True):
+                            class_path, class_profile = RollingCoin_Output.work_output(output_path, output_profile, tiled,
+                                                                                       RollingCoin_Output.copied_profile(output_profile), "_classes")
+                            class_data = RollingCoin_Output.create_output(class_path, outdata.RasterXSize, outdata.RasterYSize, gdal.GDT_Byte, class_profile, outdata, 255)
+                            write_limit_classes(outdata.GetRasterBand(1), class_data.GetRasterBand(1), [valdco for valdco, deplim in levels], nodata_new)
+                            if(RollingCoin_Output.copied_profile(output_profile)):
+                                RollingCoin_Output.copy_output(class_data, output_path, output_profile, "NEAREST")
+                            class_data = None # Close dataset
+                            if(class_path != output_path):
+                                RollingCoin_Output.remove_output(class_path)
+                        else:
+                            RollingCoin_Output.copy_output(outdata, output_path, output_profile, "NEAREST")
+
+                        outdata = None # Close dataset
+                        RollingCoin_Output.remove_output(work_path)
+            except Exception, e:
+                print "Error writing output raster. Exiting.."
+                print e
+                exit()
+    finally:
+        # Remove the mosaic VRT (also when a step above exits):
+        if(mosaic_directory is not None):
+            shutil.rmtree(mosaic_directory, ignore_errors = True)
 
-        # Create Numpy array from raster data:
-        data_array = numpy.array(data.GetRasterBand(1).ReadAsArray())
+    # Time stamp, end:
+    end_time = time.ctime()
 
-        # Create new array to hold all contour limits:
-        dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), 0, dtype = numpy.int16, order = "C")
+    print "\nProcess started:   ", start_time
+    print "Process ended:       ", end_time
 
-    except Exception:
-        print "Error reading the input data. Exiting."
+    # Write run report:
+    RollingCoin_Report.write_report(report, report_path)
+    if(report_path is not None):
+        print "Run report:          ", report_path
+
+    # Outputs are written, but the run failed without its contours (e.g. worker jobs land in failed/):
+    if(contours_failed == True):
+        print "Contours not generated. Exiting."
         exit()
+    return report
 
 
-    #
-    # # Create Coin:
-    #
+#
+# "Main method" through the result cache in cache_directory (see RollingCoin_Cache), cache_size in MB.
+# With cache_arrays set, contour limits of tiles / block windows are cached too.
+# Output tiles of a mosaic input are cached as one entry with the contours.
+#
+def cached_main(cache_directory, path, outpath, contourpath, engine = "numpy", contour_list = None, tile_size = None, workers = None, edt_radius = None,
+                coin_radius = 10, report_path = None, profile_stage = None, block_size = 256, pipeline = False, output_profile = "default", byte_output = False,
+                cache_size = 1024, cache_arrays = False, level_workers = None, output_tiles = None):
+    # Define a nodata value for arrays:
+    nodata_new = 15000 # "Deep enough"
+
+    # Contour list (current FTA production contours):
+    if(contour_list is None):
+        contour_list = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500]
+
     try:
-        coin_radius = 10 # Promising initial results using radius of 10 and 5m spatial resolution
-        coin = create_coin(coin_radius)
+        files = None
+        if(RollingCoin_Mosaic.is_mosaic(path)):
+            data, mosaic_path, files = RollingCoin_Mosaic.open_mosaic(path)
+        elif(output_tiles is not None):
+            raise Exception("Output tiles need a mosaic input.")
+        else:
+            data = gdal.Open(path, GA_ReadOnly)
+        levels = contour_levels(contour_list, data.GetRasterBand(1).ComputeRasterMinMax(0))
+        roll_radius = coin_roll_radius(engine, coin_radius, edt_radius, data.GetGeoTransform())
+        if(engine == "edt"):
+            footprint = create_edt_coin(roll_radius)
+        else:
+            footprint = RollingCoin_Filters.coin_footprint(create_coin(coin_radius), roll_radius)
+
+        # Engine, tiles, workers, level workers and blocks do not change the result (only the coin footprint does):
+        parameters = {"script": "RollingCoin_V1", "levels": levels, "footprint": footprint, "nodata_new": nodata_new,
+                      "output_profile": output_profile, "byte_output": byte_output}
+
+        # Output tiles are cached as one entry with the contours, tile windows in the key:
+        outputs = [outpath, contourpath]
+        if(output_tiles is not None):
+            tile_outputs, parameters["tiles"] = RollingCoin_Mosaic.cached_tile_outputs(data, files, output_tiles)
+            outputs = tile_outputs + [contourpath]
+        key = RollingCoin_Cache.raster_key(data, parameters)
+        data = None # Close dataset
+
     except Exception:
-        print "Error in Coin creation. Exiting."
+        print "Error reading the input data. Exiting."
         exit()
 
+    max_bytes = cache_size * 1024 * 1024
+    array_cache = None
+    if(cache_arrays == True):
+        array_cache = RollingCoin_Cache.array_cache_settings(cache_directory)
+    return RollingCoin_Cache.cached_run(cache_directory, max_bytes, key, outputs, main,
+                                        (path, outpath, contourpath, engine, contour_list, tile_size, workers, edt_radius, coin_radius, report_path, profile_stage, block_size, pipeline, output_profile, byte_output, level_workers),
+                                        {"array_cache": array_cache, "output_tiles": output_tiles})
 
-    #
-    # # Start rolling the coin:
-    #
-    try:
-        for valdco in contour_list:
-            # Get true depth limit by valdco:
-            deplim = parseDepthLimit(valdco)
-
-            # Skip contours outside data depth range:
-            if (math.fabs(deplim) < math.fabs(minimum_depth) or math.fabs(deplim) > math.fabs(maximum_depth)):
-                continue
 
-            # Generate depth limits:
-            print "\nGenerating contour limits for", valdco, "m contour:"
+#
+# Incremental update: recomputes only the changed areas of the depth model (previous_path -> path) in the contour
+# limit raster of the previous run (outpath, updated in place) and regenerates the contours (see RollingCoin_Incremental).
+# Runs main instead if the raster, NoData or contour levels have changed, or if the output has overviews (COG).
+#
+def update(previous_path, path, outpath, contourpath, engine = "numpy", contour_list = None, edt_radius = None, coin_radius = 10, block_size = 256):
+    # Get time stamp, start time:
+    start_time = time.ctime()
 
-            # Create/update "binary array":
-            print "  1. Creating GO/NOGO array.."
-            byte_array = array_to_binaryarray(data_array, deplim, nodata, nodata_new)
+    # Define a nodata value for arrays:
+    nodata_new = 15000 # "Deep enough"
 
-            # Buffer shoals create/update:
-            print "  2. Expanding shoals to ensure contour safety.."
-            buffered_array = buffer_shoals(byte_array, nodata_new)
+    # Contour list (current FTA production contours):
+    if(contour_list is None):
+        contour_list = [3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500]
 
-            # Generalize surface using rolling coin:
-            print "  3. Rolling coin.."
-            success = roll_coin(buffered_array, dest_array, coin, coin_radius - 1, nodata_new, valdco)
-            if (success is False):
-                print "Error in Coin Rolling. Exiting."
-                exit()
+    try:
+        previous_data = gdal.Open(previous_path, GA_ReadOnly)
+        previous_band = previous_data.GetRasterBand(1)
+        data = gdal.Open(path, GA_ReadOnly)
+        band = data.GetRasterBand(1)
+        nodata = band.GetNoDataValue() # Get NoData value
+        levels = contour_levels(contour_list, band.ComputeRasterMinMax(0))
+        previous_levels = contour_levels(contour_list, previous_band.ComputeRasterMinMax(0))
+        outdata = gdal.Open(outpath, GA_ReadOnly)
+        overviews = RollingCoin_Output.has_overviews(outdata)
+        byte_output = outdata.GetRasterBand(1).DataType == gdal.GDT_Byte
+        outdata = None # Close dataset
 
     except Exception:
-        print "Error in depth limit surface calculation. Exiting."
+        print "Error reading the input data. Exiting."
         exit()
 
+    if(overviews == True):
+        print "\nOutput raster has overviews (COG), running full process.."
+        return main(path, outpath, contourpath, engine, contour_list, edt_radius = edt_radius, coin_radius = coin_radius, block_size = block_size,
+                    output_profile = "cog", byte_output = byte_output)
+
+    # Changes that affect every cell:
+    if(band.XSize != previous_band.XSize or band.YSize != previous_band.YSize or data.GetGeoTransform() != previous_data.GetGeoTransform()
+       or nodata != previous_band.GetNoDataValue() or levels != previous_levels):
+        print "\nDepth model size, georeferencing, NoData or contour levels changed, running full process.."
+        return main(path, outpath, contourpath, engine, contour_list, edt_radius = edt_radius, coin_radius = coin_radius, block_size = block_size)
 
-    #
-    # # Write contour limit raster using GDAL:
-    #
     try:
-        print "\n\nExporting contour limits surface.."
-        driver = gdal.GetDriverByName("GTiff")
-        outdata = driver.Create(outpath, dest_array.shape[1], dest_array.shape[0], 1, gdal.GDT_Int16)
-        outband = outdata.GetRasterBand(1)
-        outband.SetNoDataValue(nodata_new)
-        outband.WriteArray(dest_array)
-        outdata.SetGeoTransform(data.GetGeoTransform())
-        outdata.SetProjection(data.GetProjection())
+        coin = cached_coin(coin_radius)
+        roll_radius = coin_roll_radius(engine, coin_radius, edt_radius, data.GetGeoTransform())
+    except Exception:
+        print "Error in Coin creation. Exiting."
+        exit()
+
+    try:
+        print "\nComparing depth models.."
+        changed = RollingCoin_Incremental.changed_blocks(previous_band, band, block_size)
+        halo = RollingCoin_Tiles.tile_halo(int(math.floor(roll_radius)))
+        windows = RollingCoin_Incremental.update_windows(changed, block_size, halo, band.YSize, band.XSize)
+        print numpy.count_nonzero(changed), "of", changed.size, "blocks changed"
+
+        print "Updating contour limits for", ", ".join([str(valdco) for valdco, deplim in levels]), "m contours.."
+        outdata = gdal.Open(outpath, GA_Update)
+        if(outdata.GetRasterBand(1).DataType != gdal.GDT_Int16):
+            raise Exception("Byte class outputs can not be updated, run main instead.")
+        cells = RollingCoin_Incremental.update_band(band, outdata.GetRasterBand(1), windows, create_tile_limits, (nodata, nodata_new, coin, roll_radius, levels, engine))
         outdata = None # Close dataset
+        print cells, "of", band.XSize * band.YSize, "cells recomputed"
+
     except Exception, e:
-        print "Error exporting contour limit surface. Exiting.."
+        print "Error updating contour limit surface. Exiting.."
         print e
         exit()
 
+    contours_failed = False
     try:
-        print "\nGenerating raw contours.."
-        contour_command = 'gdal_contour -f "ESRI Shapefile" -i 1 -a VALDCO -b 1 ' + outpath + " " + contourpath
-        os.system(contour_command)
-    except Exception:
-        print "Error generating raw contours. Contour shapefile not generated."
+        if(numpy.any(changed)):
+            print "\nGenerating contours.."
+            contour_data = gdal.Open(outpath, GA_ReadOnly)
+            create_contours(contour_data.GetRasterBand(1), contourpath, [valdco for valdco, deplim in levels], nodata_new, data.GetProjection())
+            contour_data = None # Close dataset
+    except Exception, e:
+        print "Error generating contours. Contour shapefile not generated."
+        print e
+        contours_failed = True
 
     # Time stamp, end:
     end_time = time.ctime()
@@ -350,38 +1563,37 @@ def main(path, outpath, contourpath):
     print "\nProcess started:   ", start_time
     print "Process ended:       ", end_time
 
-
-#
-# Optional method, does part of the vector contour post-processing
-# This optional method depends on GeoPandas (see http://geopandas.org/)
-#
-def filter_contours(raw_contourpath, export_contourpath):
-    try:
-        import geopandas as gpd
-        data = gpd.read_file(raw_contourpath)
-        data["VALDCO"] = data["VALDCO"].astype("int")
-        product_contours = data.loc[data["VALDCO"].isin([3, 6, 10, 13, 15, 20, 30, 50, 100, 200, 500])] # FTA Production contours
-        product_contours.to_file(export_contourpath)
-    except Exception:
-        print "\nContour filtering failed. Raw contours still available:", raw_contourpath
-        return
-
-    try:
-        del_command = "del " + raw_contourpath.split(".")[0] + ".*"
-        os.system(del_command)
-    except Exception:
-        "Couldn't delete raw contour file."
-        return
+    # Output is updated, but the run failed without its contours:
+    if(contours_failed == True):
+        print "Contours not generated. Exiting."
+        exit()
 
 
 # # # # # # # # # # # #
 # Start the process:  #
 # # # # # # # # # # # #
 
-depth_model = R"C:\Users\User\Path\Depthmodel.tif"
+depth_model = R"C:\Users\User\Path\Depthmodel.tif" # GeoTIFF, or a mosaic: VRT file, list of files, directory or pattern (e.g. R"C:\Users\User\Path\Tiles\*.tif")
 output_path = R"C:\Users\User\Path\Output\Contour_limits.tif"
-raw_contours = R"C:\Users\User\Path\Output\RAW_Contours.shp"
-filtered_contours = R"C:\Users\User\Path\Output\Contours.shp"
-
-main(depth_model, output_path, raw_contours)
-filter_contours(raw_contours, filtered_contours)
+output_tiles = None # None (output_path) or directory of output tiles, one per source file of a mosaic depth model
+contours = R"C:\Users\User\Path\Output\Contours.shp"
+engine = "numpy" # "numpy" (whole-array engine), "multilevel" (all contour levels in one pass), "band" (coin tested only near shoals), "packed" (bit-packed masks, least memory), "edt" (distance transform, round coins), "index" (cell-by-cell with shoal index) or "loop" (reference cell-by-cell loops)
+tile_size = None # None (whole raster in memory) or tile size in cells (e.g. 2048) for rasters larger than memory
+workers = None # None (single process) or number of worker processes for tiles (0 = all CPU cores)
+level_workers = None # None (contour levels one by one) or number of worker processes rolling contour levels in parallel (0 = all CPU cores), whole raster only (tile_size None)
+pipeline = False # True: tiles are read and written by background threads while tiles are processed
+output_profile = "default" # Output raster: "default" (striped GeoTIFF), "tiled", "deflate" / "zstd" (tiled, compressed) or "cog" (Cloud Optimized GeoTIFF with overviews)
+byte_output = False # True: contour limits as byte classes with a color table (category names = VALDCO)
+run_report = None # None or path of JSON run report (stage times, memory, cell counts), e.g. R"C:\Users\User\Path\Output\Run_report.json"
+profile_stage = None # None or stage to profile with cProfile: "read", "binary_array", "buffer_shoals", "roll_coin", "roll_coin_levels", "parallel_levels", "export", "tiles" or "contour"
+cache_directory = None # None or result cache directory (reprocessing an unchanged depth model copies the cached outputs), e.g. R"C:\Users\User\Path\Cache"
+cache_size = 1024 # Result cache size cap in MB
+
+if __name__ == "__main__": # Worker processes import this script
+    if(cache_directory is None):
+        main(depth_model, output_path, contours, engine, tile_size = tile_size, workers = workers, report_path = run_report, profile_stage = profile_stage,
+             pipeline = pipeline, output_profile = output_profile, byte_output = byte_output, level_workers = level_workers, output_tiles = output_tiles)
+    else:
+        cached_main(cache_directory, depth_model, output_path, contours, engine, tile_size = tile_size, workers = workers, report_path = run_report,
+                    profile_stage = profile_stage, pipeline = pipeline, output_profile = output_profile, byte_output = byte_output, cache_size = cache_size,
+                    level_workers = level_workers, output_tiles = output_tiles)
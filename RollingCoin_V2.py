@@ -12,16 +12,35 @@
 # Depends on:
 # 1. GDAL (see http://www.gdal.org/)
 # 2. NumPy (see http://www.numpy.org/)
+# 3. RollingCoin_Tiles.py (tiled processing)
+# 4. RollingCoin_Report.py (run report)
+# 5. RollingCoin_Blocks.py (NoData block index)
+# 6. RollingCoin_Incremental.py (incremental updates)
+# 7. RollingCoin_Cache.py (result cache)
+# 8. RollingCoin_Output.py (output profiles)
+# 9. RollingCoin_Mosaic.py (mosaic inputs)
+# 10. RollingCoin_Filters.py (coin focal filters)
 
 # # # # # # # # #
 #   Imports:    #
 # # # # # # # # #
 
 try:
+    import os
+    import shutil
+    import tempfile
     import numpy
     import math
     from osgeo import gdal, osr
     from gdalconst import *
+    import RollingCoin_Tiles
+    import RollingCoin_Report
+    import RollingCoin_Blocks
+    import RollingCoin_Incremental
+    import RollingCoin_Cache
+    import RollingCoin_Output
+    import RollingCoin_Mosaic
+    import RollingCoin_Filters
 
 except Exception:
     print "Dependencies not installed? Make sure GDAL and NumPy are installed. Exiting."
@@ -116,6 +135,65 @@ def buffer_shoals(src_array, nodata):
     return          # Return
 
 
+#
+# Vectorized buffer_shoals: separable 3 x 3 focal max, processed in strips of strip_rows rows.
+# Scratch per strip: window (strip + 2 rows), row_max, shoalest, update mask and, with NaN cells, first_neighbor.
+# Cells whose first neighbor in buffer_shoals order is NaN are not updated (Python max() keeps a NaN first argument).
+#
+def buffer_shoals_numpy(src_array, nodata, strip_rows = 256):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+    floating = numpy.issubdtype(src_array.dtype, numpy.floating)
+    fill = -numpy.inf if floating else numpy.iinfo(src_array.dtype).min    # Never the max (rows outside the array)
+    previous_row = None     # Original values of the row above the strip
+
+    for start in range(0, rows, strip_rows):
+        end = min(rows, start + strip_rows)
+        count = end - start
+
+        # Original values of the strip with the rows above and below it (row below is not updated yet):
+        window = numpy.full((count + 2, columns), fill, dtype = src_array.dtype)
+        window[1 : count + 1] = src_array[start : end]
+        if(previous_row is not None):
+            window[0] = previous_row
+        if(end < rows):
+            window[count + 1] = src_array[end]
+        previous_row = window[count].copy()
+
+        # Row pass (3 cells, edges clipped), NaN neighbors ignored:
+        row_max = window.copy()
+        if(columns > 1):
+            numpy.fmax(row_max[:, 1:], window[:, :-1], out = row_max[:, 1:])
+            numpy.fmax(row_max[:, :-1], window[:, 1:], out = row_max[:, :-1])
+
+        # Column pass (3 rows):
+        shoalest = numpy.fmax(row_max[:-2], row_max[1:-1])
+        numpy.fmax(shoalest, row_max[2:], out = shoalest)
+        del row_max
+
+        strip = src_array[start : end]
+        with numpy.errstate(invalid = "ignore"):
+            update = (shoalest > strip) & (shoalest > -99999.0)
+        if(nodata is not None):
+            update &= strip != nodata
+
+        # Cells whose first neighbor in buffer_shoals argument order is NaN are not updated:
+        if(floating == True and numpy.isnan(window).any()):
+            first_neighbor = numpy.full((count, columns), numpy.nan, dtype = src_array.dtype)
+            if(columns > 1):
+                first_neighbor[:, 1:] = window[1 : count + 1, :-1]                     # Left (top and bottom rows, last column)
+                middle_first = max(start, 1) - start
+                middle_end = min(end, rows - 1) - start
+                if(middle_end > middle_first):
+                    first_neighbor[middle_first : middle_end, 1 : -1] = window[middle_first : middle_end, : -2]    # Upper left (middle rows)
+                first_neighbor[:, 0] = window[1 : count + 1, 1]                        # Right (first column)
+            update &= ~numpy.isnan(first_neighbor)
+
+        strip[update] = shoalest[update]
+
+    return
+
+
 #
 # Creates and returns a "Coin".
 # Coin is a boolean 2D array and can be of any shape - this example approximates round coins.
@@ -131,6 +209,19 @@ def create_coin(radius, trim_flag):
         return ret                  # Return coin as is (no trimming)
 
 
+# Coins created so far (see cached_coin):
+coin_cache = {}
+
+
+#
+# Returns the coin of a radius and trim flag, created once per process. The returned coin is shared: do not modify it.
+#
+def cached_coin(radius, trim_flag):
+    if((radius, trim_flag) not in coin_cache):
+        coin_cache[(radius, trim_flag)] = create_coin(radius, trim_flag)
+    return coin_cache[(radius, trim_flag)]
+
+
 #
 # Returns shoalest depth on coin area, depending on the cells tested
 #
@@ -190,75 +281,612 @@ def roll_coin(src_array, dest_array, coin, radius, nodata):
     return
 
 
+#
+# Whole-array version of check_coin: returns coin_ok (boolean) and shoalest depth (0 where coin is not ok) arrays.
+# inner_max is the focal maximum with the coin if already computed (coin_filter), None computes it.
+#
+# MISSING: Same edge behaviour as check_coin - cells closer than radius to the array edge are never ok.
+#
+def check_coin_numpy(coin, radius, array, inner_max = None):
+    rows = array.shape[0]
+    columns = array.shape[1]
+
+    coin_ok = numpy.zeros((rows, columns), dtype = numpy.bool_)
+    shoalest = numpy.zeros((rows, columns), dtype = array.dtype)
+
+    inner_rows = rows - 2 * radius          # Number of coin centers inside array (rows)
+    inner_columns = columns - 2 * radius    # Number of coin centers inside array (columns)
+    if(inner_rows <= 0 or inner_columns <= 0):
+        return coin_ok, shoalest            # Coin never fits
+
+    # Focal maximum with the coin:
+    if(inner_max is None):
+        inner_max = RollingCoin_Filters.coin_filter(array, RollingCoin_Filters.coin_footprint(coin, radius), numpy.fmax)
+
+    if(inner_max is None):
+        return coin_ok, shoalest            # Empty coin
+
+    # check_coin starts from -99999.0 and only accepts strictly shoaler depths:
+    with numpy.errstate(invalid = "ignore"):
+        inner_ok = inner_max > -99999.0     # All-NaN coins stay False
+    coin_ok[radius : radius + inner_rows, radius : radius + inner_columns] = inner_ok
+    shoalest[radius : radius + inner_rows, radius : radius + inner_columns] = numpy.where(inner_ok, inner_max, 0)
+
+    return coin_ok, shoalest
+
+
+#
+# Whole-array version of roll_coin: focal max with the coin, then focal min of the accepted depths (grey closing).
+# inner_max: see check_coin_numpy.
+#
+def roll_coin_numpy(src_array, dest_array, coin, radius, nodata, inner_max = None):
+    rows = src_array.shape[0]
+    columns = src_array.shape[1]
+
+    # Check all coin positions at once:
+    coin_ok, shoalest = check_coin_numpy(coin, radius, src_array, inner_max)
+
+    inner_rows = rows - 2 * radius
+    inner_columns = columns - 2 * radius
+
+    if(inner_rows > 0 and inner_columns > 0):
+        # Accepted coins write their shoalest depth, others write nothing (infinitely deep):
+        inner_ok = coin_ok[radius : radius + inner_rows, radius : radius + inner_columns]
+        inner_shoalest = shoalest[radius : radius + inner_rows, radius : radius + inner_columns]
+        written = numpy.where(inner_ok, inner_shoalest, RollingCoin_Filters.filter_fill(dest_array.dtype, numpy.minimum)).astype(dest_array.dtype)
+
+        # Focal minimum with the coin:
+        rolled = RollingCoin_Filters.coin_spread(written, RollingCoin_Filters.coin_footprint(coin, radius), numpy.minimum)
+
+        # Destination cells can only get shoaler than their current value:
+        numpy.minimum(dest_array, rolled, out = dest_array)
+
+    # Restore original nodata values:
+    dest_array[src_array == nodata] = nodata
+
+    return
+
+
+#
+# Creates the "Rolling Coin" surface of a depth model array: buffers shoals and rolls the coin.
+# With array_cache set (RollingCoin_Cache.array_cache_settings), the surface is cached by depths and coin footprint.
+# Note: data_array is modified (shoals buffered, not on a cache hit). Returns the surface array.
+#
+def create_surface(data_array, nodata, coin, radius, engine, array_cache = None, report = None):
+    # Cached surface (engines give the same result):
+    if(array_cache is not None):
+        key_parts = (data_array, nodata, RollingCoin_Filters.coin_footprint(coin, radius))
+        return RollingCoin_Cache.cached_array(array_cache, "V2 surface", key_parts, create_surface, (data_array, nodata, coin, radius, engine, None, report))
+
+    # Create a new NumPy array to hold smooth surface:
+    initial_elevation = 10000
+    dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), initial_elevation, dtype = numpy.float32, order = "C")
+    buffer_and_roll(data_array, dest_array, nodata, coin, radius, engine, report)
+    return dest_array
+
+
+#
+# Buffers shoals of data_array (in place) and rolls the coin into dest_array (see create_surface).
+#
+def buffer_and_roll(data_array, dest_array, nodata, coin, radius, engine, report = None):
+    with RollingCoin_Report.stage(report, "buffer_shoals"):
+        if(engine == "numpy"):
+            buffer_shoals_numpy(data_array, nodata)     # Whole-array engine
+        else:
+            buffer_shoals(data_array, nodata)           # Reference cell-by-cell loops
+    with RollingCoin_Report.stage(report, "roll_coin") as record:
+        if(report is not None):
+            record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(data_array, nodata)
+        if(engine == "numpy"):
+            roll_coin_numpy(data_array, dest_array, coin, radius, nodata)    # Whole-array engine
+        else:
+            roll_coin(data_array, dest_array, coin, radius, nodata)          # Reference cell-by-cell loops
+
+    return
+
+
+# Initial value (code) of quantized surfaces, the class of initial_elevation:
+class_initial = 255
+
+
+#
+# Contour class lookup of quantized surfaces: returns the contour depths (deepest first) and the depth of each class code.
+# Class i (number of deeper contour depths) has data code 2 * i + 2 and NoData code 2 * i + 1, and maps to its shoalest
+# depth (next shoaler contour depth, or max_depth). Up to 126 contour depths.
+#
+def contour_classes(contour_depths, max_depth, nodata = None):
+    limits = numpy.unique(numpy.array(contour_depths, dtype = numpy.float32))
+    if(limits.size == 0 or 2 * limits.size + 2 >= class_initial):
+        raise Exception("Contour classes need 1 - 126 contour depths.")
+    if(max_depth is None or max_depth < limits[-1]):
+        max_depth = limits[-1]
+    if(nodata is not None and nodata > max_depth):
+        max_depth = nodata
+
+    class_depths = numpy.full(256, limits[0], dtype = numpy.float32)
+    class_depths[1 : 2 * limits.size + 3] = numpy.repeat(numpy.append(limits, numpy.float32(max_depth)), 2)
+    class_depths[class_initial] = 10000     # initial_elevation of create_surface
+    return limits, class_depths
+
+
+#
+# Maps a depth model array to 8-bit contour class codes (see contour_classes), raises an exception for NaN cells.
+# Returns the code array and the NoData code (None without NoData).
+#
+def classify_depths(data_array, nodata, limits):
+    if(numpy.issubdtype(data_array.dtype, numpy.floating) and numpy.isnan(data_array).any()):
+        raise Exception("Contour classes need a depth model without NaN cells, set NaN cells to NoData.")
+    codes = numpy.zeros((data_array.shape[0], data_array.shape[1]), dtype = numpy.uint8)
+    with numpy.errstate(invalid = "ignore"):
+        for limit in limits:
+            codes += data_array > limit
+    codes *= 2
+    codes += 2
+
+    nodata_code = None
+    if(nodata is not None):
+        nodata_code = 2 * int(numpy.count_nonzero(limits < nodata)) + 1
+        codes[data_array == nodata] = nodata_code
+    return codes, nodata_code
+
+
+#
+# Contour class version of create_surface: the coin is rolled on 8-bit class codes and the result is the create_surface
+# surface rounded up to the shoalest depth of its class. data_array is not modified. Returns the surface array.
+#
+def create_surface_classes(data_array, nodata, coin, radius, engine, limits, class_depths, array_cache = None, report = None):
+    # Cached surface (array_cache: see create_surface):
+    if(array_cache is not None):
+        key_parts = (data_array, nodata, RollingCoin_Filters.coin_footprint(coin, radius), limits, class_depths)
+        return RollingCoin_Cache.cached_array(array_cache, "V2 surface classes", key_parts, create_surface_classes,
+                                              (data_array, nodata, coin, radius, engine, limits, class_depths, None, report))
+
+    with RollingCoin_Report.stage(report, "classify"):
+        codes, nodata_code = classify_depths(data_array, nodata, limits)
+
+    dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), class_initial, dtype = numpy.uint8, order = "C")
+    buffer_and_roll(codes, dest_array, nodata_code, coin, radius, engine, report)
+
+    # Back to depths, the NoData code is the NoData value only (original nodata values were restored by roll_coin):
+    surface = class_depths[dest_array]
+    if(nodata_code is not None):
+        surface[dest_array == nodata_code] = nodata
+    return surface
+
+
+#
+# Creates the "Rolling Coin" surfaces for several coins (coins and radii lists), shoals buffered once and coin filters
+# shared. Note: data_array is modified (shoals buffered). Returns the surfaces stacked on the last axis.
+#
+def create_surfaces(data_array, nodata, coins, radii, engine, report = None):
+    rows = data_array.shape[0]
+    columns = data_array.shape[1]
+    initial_elevation = 10000
+    dest_array = numpy.full((rows, columns, len(coins)), initial_elevation, dtype = numpy.float32)
+
+    with RollingCoin_Report.stage(report, "buffer_shoals"):
+        if(engine == "numpy"):
+            buffer_shoals_numpy(data_array, nodata)
+        else:
+            buffer_shoals(data_array, nodata)
+
+    # Focal maximum of each coin that fits the array, sliding filters shared:
+    inner_maxes = [None] * len(coins)
+    if(engine == "numpy"):
+        with RollingCoin_Report.stage(report, "coin_filters"):
+            fitting = [number for number in range(len(coins)) if rows > 2 * radii[number] and columns > 2 * radii[number]]
+            filtered = RollingCoin_Filters.coin_filters(data_array, [RollingCoin_Filters.coin_footprint(coins[number], radii[number]) for number in fitting], numpy.fmax)
+            for number, inner_max in zip(fitting, filtered):
+                inner_maxes[number] = inner_max
+
+    for number in range(len(coins)):
+        with RollingCoin_Report.stage(report, "roll_coin", radii[number] + 1) as record:
+            if(report is not None):
+                record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(data_array, nodata)
+            surface = numpy.full((rows, columns), initial_elevation, dtype = numpy.float32)
+            if(engine == "numpy"):
+                roll_coin_numpy(data_array, surface, coins[number], radii[number], nodata, inner_maxes[number])
+            else:
+                roll_coin(data_array, surface, coins[number], radii[number], nodata)
+            inner_maxes[number] = None # Free memory
+            dest_array[:, :, number] = surface
+
+    return dest_array
+
+
+#
+# Returns the surface function for tiles and blocks and its arguments (create_surface or create_surface_classes).
+#
+def surface_function(nodata, coin, radius, engine, classes = None, array_cache = None):
+    if(classes is not None):
+        return create_surface_classes, (nodata, coin, radius, engine) + tuple(classes) + (array_cache,)
+    return create_surface, (nodata, coin, radius, engine, array_cache)
+
+
+#
+# Creates the "Rolling Coin" surface of a whole depth model array, with block_size set only the blocks with data.
+# Note: data_array may be modified (shoals buffered).
+# With classes (contour_classes) set, the quantized surface is created (see create_surface_classes).
+# Returns the surface array.
+#
+def roll_surface(data_array, nodata, coin, radius, engine, block_size, verbose = False, report = None, classes = None, array_cache = None):
+    function, args = surface_function(nodata, coin, radius, engine, classes, array_cache)
+    if(block_size is None):
+        if(verbose == True):
+            print "\nBuffering shoals.."
+            print "Rolling coin.."
+        return function(data_array, *(args + (report,)))
+
+    # Index NoData blocks once, process only blocks with data:
+    with RollingCoin_Report.stage(report, "block_index") as record:
+        index = RollingCoin_Blocks.block_index(data_array, nodata, block_size)
+        record.update(RollingCoin_Blocks.block_statistics(index, block_size, data_array.shape[0], data_array.shape[1]))
+    if(verbose == True):
+        print "\nBuffering shoals and rolling coin,", record["nodata_blocks"], "of", index.size, "blocks NoData.."
+
+    halo = RollingCoin_Tiles.tile_halo(radius)
+    return RollingCoin_Blocks.process_blocks(data_array, index, block_size, halo, nodata, numpy.float32, function, args + (report,))
+
+
+#
+# Multi-coin version of roll_surface (see create_surfaces). Note: data_array may be modified (shoals buffered).
+# Returns the surfaces stacked on the last axis.
+#
+def roll_surfaces(data_array, nodata, coins, radii, engine, block_size, verbose = False, report = None):
+    surface_args = (nodata, coins, radii, engine, report)
+    if(block_size is None):
+        if(verbose == True):
+            print "\nBuffering shoals and rolling coins.."
+        return create_surfaces(data_array, *surface_args)
+
+    # Index NoData blocks once, process only blocks with data (halo of the largest coin):
+    with RollingCoin_Report.stage(report, "block_index") as record:
+        index = RollingCoin_Blocks.block_index(data_array, nodata, block_size)
+        record.update(RollingCoin_Blocks.block_statistics(index, block_size, data_array.shape[0], data_array.shape[1]))
+    if(verbose == True):
+        print "\nBuffering shoals and rolling coins,", record["nodata_blocks"], "of", index.size, "blocks NoData.."
+
+    if(numpy.all(index == RollingCoin_Blocks.data_block)):
+        return create_surfaces(data_array, *surface_args)
+
+    halo = RollingCoin_Tiles.tile_halo(max(radii))
+    windows = RollingCoin_Blocks.block_windows(index != RollingCoin_Blocks.nodata_block, block_size, halo, data_array.shape[0], data_array.shape[1])
+    dest_array = numpy.full((data_array.shape[0], data_array.shape[1], len(radii)), nodata, dtype = numpy.float32)
+    return RollingCoin_Blocks.process_windows(data_array, dest_array, windows, create_surfaces, surface_args)
+
+
 #
 # "Main method":
+# tile_size (cells): tile by tile processing (see RollingCoin_Tiles), workers: parallel tiles (0 = all CPU cores),
+# pipeline: background read / write threads.
+# report_path / profile_stage: JSON run report / stage profiled with cProfile (see RollingCoin_Report).
+# block_size (cells): all NoData blocks are skipped (see RollingCoin_Blocks), None processes all cells.
+# output_profile: output raster format (see RollingCoin_Output).
+# inpath can also be a mosaic (see RollingCoin_Mosaic), output_tiles: directory of one output tile per source file.
+# contour_depths (negative depths, e.g. [-3.09, -6.09]): coin rolled on 8-bit contour classes (see create_surface_classes).
+# array_cache is the intermediate array cache of cached_main (see create_surface).
 #
-def main(inpath, outpath, radius, trim):
+def main(inpath, outpath, radius, trim, engine = "numpy", tile_size = None, workers = None, report_path = None, profile_stage = None, block_size = 256,
+         pipeline = False, output_profile = "default", output_tiles = None, contour_depths = None, array_cache = None):
+    # Parallel processing is tiled:
+    if(workers is not None and tile_size is None):
+        tile_size = 1024
+
+    # Run report:
+    parameters = {"input": inpath, "radius": radius, "trim": trim, "engine": engine, "tile_size": tile_size, "workers": workers, "block_size": block_size,
+                  "pipeline": pipeline, "output_profile": output_profile, "output_tiles": output_tiles, "contour_depths": contour_depths}
+    report = RollingCoin_Report.create_report("RollingCoin_V2", parameters, profile_stage, report_path)
 
     #
     # # Read in the data and get original nodata value and depth min/max:
     #
+    files = None
+    mosaic_path = None
+    mosaic_directory = None
     try:
-        data = gdal.Open(inpath, GA_ReadOnly)   # Open dataset in read-only mode (GDAL)
-        band = data.GetRasterBand(1)            # Get elevation band
-        nodata = band.GetNoDataValue()          # Get NoData value
+        try:
+            with RollingCoin_Report.stage(report, "read") as record:
+                if(RollingCoin_Mosaic.is_mosaic(inpath)):
+                    # Source files through a VRT (no merged copy), processed by source tiles:
+                    mosaic_directory = tempfile.mkdtemp(prefix = "rollingcoin_")
+                    data, mosaic_path, files = RollingCoin_Mosaic.open_mosaic(inpath, mosaic_directory)
+                    record["source_files"] = len(files)
+                elif(output_tiles is not None):
+                    raise Exception("Output tiles need a mosaic input.")
+                else:
+                    data = gdal.Open(inpath, GA_ReadOnly)   # Open dataset in read-only mode (GDAL)
+                band = data.GetRasterBand(1)            # Get elevation band
+                nodata = band.GetNoDataValue()          # Get NoData value
+                tiled = tile_size is not None or files is not None
+
+                # Contour classes, depths shoaler than all contours get the shoalest depth of the depth model:
+                classes = None
+                if(contour_depths is not None):
+                    classes = contour_classes(contour_depths, band.ComputeRasterMinMax(0)[1], nodata)
+
+                # Fetch data to a NumPy array (tiled processing reads tiles later):
+                if(tiled == False):
+                    data_array = numpy.array(data.GetRasterBand(1).ReadAsArray())
+                    if(report is not None):
+                        record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(data_array, nodata)
+                else:
+                    record["cells"] = band.XSize * band.YSize
+    
+        except Exception:
+            print "Error loading the data. Exiting."
+            exit()
+
+
+        #
+        # # Create Coin:
+        #
+        try:
+            coin_radius = radius
+            trimflag = trim
+            coin = cached_coin(coin_radius, trimflag)
+            print "\nCoin OK, radius = " + str(coin_radius) + ", Trim =", trimflag 
+    
+        except Exception:
+            print "Error in coin creation. Exiting."
+            exit()
 
-        # Fetch data to a NumPy array:
-        data_array = numpy.array(data.GetRasterBand(1).ReadAsArray())
 
-        # Create a new NumPy array to hold smooth surface:
-        initial_elevation = 10000
-        dest_array = numpy.full((data_array.shape[0], data_array.shape[1]), initial_elevation, dtype = numpy.float32, order = "C")
+        #
+        # # Start rolling the coin:
+        #
+        try:
+            if(tiled == False):
+                dest_array = roll_surface(data_array, nodata, coin, coin_radius - 1, engine, block_size, True, report, classes, array_cache)
     
+        except Exception:
+            print "Error in surface manipulation. Exiting."
+            exit()
+    
+        #
+        # # Write surface using GDAL:
+        #
+        try:
+            print "\n\nExporting surface.."
+            with RollingCoin_Report.stage(report, "export" if tiled == False else "tiles") as record:
+                halo = RollingCoin_Tiles.tile_halo(coin_radius - 1)
+                tiles = None
+                if(files is not None):
+                    tiles = RollingCoin_Mosaic.source_tiles(data, files, halo)
+
+                # COG output is copied from the finished surface:
+                copied_output = RollingCoin_Output.copied_profile(output_profile)
+                if(output_tiles is None):
+                    work_path, work_profile = RollingCoin_Output.work_output(outpath, output_profile, tiled, copied_output)
+                    outdata = RollingCoin_Output.create_output(work_path, band.XSize, band.YSize, gdal.GDT_Float32, work_profile, data, nodata)
+                    outband = outdata.GetRasterBand(1)
+                    outputs = [(work_path, outpath)]
+                else:
+                    # One output tile per source file:
+                    tile_outpaths = RollingCoin_Mosaic.tile_paths(files, output_tiles)
+                    work_paths, outdata = RollingCoin_Mosaic.create_tile_outputs(files, tiles, tile_outpaths, gdal.GDT_Float32, output_profile, copied_output, nodata)
+                    work_profile = output_profile
+                    outband = outdata
+                    outputs = zip(work_paths, tile_outpaths)
+
+                if(tiled == False):
+                    outband.WriteArray(dest_array)
+                else:
+                    # Buffer, roll and write tile by tile (read, roll and export in one stage):
+                    try:
+                        if(files is None):
+                            print "Buffering shoals and rolling coin in tiles of", tile_size, "cells.."
+                        else:
+                            print "Buffering shoals and rolling coin in", len(files), "source tiles.."
+                        record["cells"] = band.XSize * band.YSize
+                        tile_function, tile_args = surface_function(nodata, coin, coin_radius - 1, engine, classes, array_cache)
+                        if(block_size is None):
+                            RollingCoin_Tiles.process_tiled(band, outband, tile_size, halo, tile_function, tile_args, workers, pipeline, tiles, mosaic_path)
+                        else:
+                            # Skip NoData blocks of each tile:
+                            RollingCoin_Tiles.process_tiled(band, outband, tile_size, halo, RollingCoin_Blocks.process_tile_blocks,
+                                                            (nodata, block_size, halo, nodata, numpy.float32, tile_function, tile_args), workers, pipeline, tiles, mosaic_path)
+                    except Exception:
+                        print "Error in surface manipulation. Exiting."
+                        exit()
+
+                if(copied_output == True):
+                    if(work_profile != "memory"):
+                        outband = None
+                        outdata = None # Close (flush) temporary files
+                    for work_path, output_path in outputs:
+                        if(work_profile != "memory"):
+                            outdata = gdal.Open(work_path, GA_ReadOnly)
+                        RollingCoin_Output.copy_output(outdata, output_path, output_profile, "NEAREST")
+                        outdata = None # Close dataset
+                        RollingCoin_Output.remove_output(work_path)
+                outband = None
+                outdata = None # Close dataset
+            print "Done.\n"
+    
+        except Exception:
+            print "Error exporting the surface. Exiting."
+            exit()
+    finally:
+        # Remove the mosaic VRT (also when a step above exits):
+        if(mosaic_directory is not None):
+            shutil.rmtree(mosaic_directory, ignore_errors = True)
+
+    # Write run report:
+    RollingCoin_Report.write_report(report, report_path)
+    if(report_path is not None):
+        print "Run report:", report_path
+    return report
+
+
+#
+# Multi-radius "Main method": writes one surface per coin radius (radii list) to outpaths from one read (see create_surfaces).
+# The whole raster is processed in memory.
+# output_profile sets the output raster format (see RollingCoin_Output).
+#
+def main_radii(inpath, outpaths, radii, trim, engine = "numpy", report_path = None, profile_stage = None, block_size = 256, output_profile = "default"):
+    # Run report:
+    parameters = {"input": inpath, "radii": radii, "trim": trim, "engine": engine, "block_size": block_size, "output_profile": output_profile}
+    report = RollingCoin_Report.create_report("RollingCoin_V2", parameters, profile_stage, report_path)
+
+    try:
+        with RollingCoin_Report.stage(report, "read") as record:
+            data = gdal.Open(inpath, GA_ReadOnly)   # Open dataset in read-only mode (GDAL)
+            band = data.GetRasterBand(1)            # Get elevation band
+            nodata = band.GetNoDataValue()          # Get NoData value
+            data_array = numpy.array(band.ReadAsArray())
+            if(report is not None):
+                record["cells"], record["nodata_cells"] = RollingCoin_Report.count_cells(data_array, nodata)
+
     except Exception:
         print "Error loading the data. Exiting."
         exit()
 
-
-    #
-    # # Create Coin:
-    #
     try:
-        coin_radius = radius
-        trimflag = trim
-        coin = create_coin(coin_radius, trimflag)
-        print "\nCoin OK, radius = " + str(coin_radius) + ", Trim =", trimflag 
-    
+        coins = [cached_coin(radius, trim) for radius in radii]
+        print "\nCoins OK, radii = " + ", ".join([str(radius) for radius in radii]) + ", Trim =", trim
     except Exception:
         print "Error in coin creation. Exiting."
         exit()
 
-
-    #
-    # # Start rolling the coin:
-    #
     try:
-        print "\nBuffering shoals.."
-        buffer_shoals(data_array, nodata)
-        print "Rolling coin.."
-        roll_coin(data_array, dest_array, coin, coin_radius - 1, nodata)
-    
+        dest_array = roll_surfaces(data_array, nodata, coins, [radius - 1 for radius in radii], engine, block_size, True, report)
+
     except Exception:
         print "Error in surface manipulation. Exiting."
         exit()
-    
-    #
-    # # Write surface using GDAL:
-    #
+
     try:
-        print "\n\nExporting surface.."
-        driver = gdal.GetDriverByName("GTiff")
-        outdata = driver.Create(outpath, dest_array.shape[1], dest_array.shape[0], 1, gdal.GDT_Float32)
-        outband = outdata.GetRasterBand(1)
-        outband.SetNoDataValue(nodata)
-        outband.WriteArray(dest_array)
-        outdata.SetGeoTransform(data.GetGeoTransform())
-        outdata.SetProjection(data.GetProjection())
+        print "\n\nExporting surfaces.."
+        for number in range(len(radii)):
+            with RollingCoin_Report.stage(report, "export", radii[number]):
+                copied_output = RollingCoin_Output.copied_profile(output_profile)
+                work_path, work_profile = RollingCoin_Output.work_output(outpaths[number], output_profile, False, copied_output)
+                outdata = RollingCoin_Output.create_output(work_path, band.XSize, band.YSize, gdal.GDT_Float32, work_profile, data, nodata)
+                outdata.GetRasterBand(1).WriteArray(numpy.ascontiguousarray(dest_array[:, :, number]))
+                if(copied_output == True):
+                    RollingCoin_Output.copy_output(outdata, outpaths[number], output_profile, "NEAREST")
+                outdata = None # Close dataset
+            print "Radius", radii[number], "->", outpaths[number]
+        print "Done.\n"
+
+    except Exception:
+        print "Error exporting the surfaces. Exiting."
+        exit()
+
+    # Write run report:
+    RollingCoin_Report.write_report(report, report_path)
+    if(report_path is not None):
+        print "Run report:", report_path
+    return report
+
+
+#
+# "Main method" through the result cache in cache_directory (see RollingCoin_Cache), cache_size in MB.
+# With cache_arrays set, surfaces of tiles / block windows are cached too.
+# Output tiles of a mosaic input are cached as one entry.
+#
+def cached_main(cache_directory, inpath, outpath, radius, trim, engine = "numpy", tile_size = None, workers = None, report_path = None, profile_stage = None,
+                block_size = 256, pipeline = False, output_profile = "default", cache_size = 1024, cache_arrays = False,
+                contour_depths = None, output_tiles = None):
+    try:
+        files = None
+        if(RollingCoin_Mosaic.is_mosaic(inpath)):
+            data, mosaic_path, files = RollingCoin_Mosaic.open_mosaic(inpath)
+        elif(output_tiles is not None):
+            raise Exception("Output tiles need a mosaic input.")
+        else:
+            data = gdal.Open(inpath, GA_ReadOnly)
+
+        # Engine, tiles, workers and blocks do not change the result (only the coin footprint and contour classes do):
+        parameters = {"script": "RollingCoin_V2", "footprint": RollingCoin_Filters.coin_footprint(create_coin(radius, trim), radius - 1),
+                      "output_profile": output_profile}
+        if(contour_depths is not None):
+            parameters["contour_depths"] = sorted(contour_depths)
+
+        # Output tiles are cached as one entry, tile windows in the key:
+        outputs = [outpath]
+        if(output_tiles is not None):
+            outputs, parameters["tiles"] = RollingCoin_Mosaic.cached_tile_outputs(data, files, output_tiles)
+        key = RollingCoin_Cache.raster_key(data, parameters)
+        data = None # Close dataset
+
+    except Exception:
+        print "Error loading the data. Exiting."
+        exit()
+
+    max_bytes = cache_size * 1024 * 1024
+    array_cache = None
+    if(cache_arrays == True):
+        array_cache = RollingCoin_Cache.array_cache_settings(cache_directory)
+    return RollingCoin_Cache.cached_run(cache_directory, max_bytes, key, outputs, main,
+                                        (inpath, outpath, radius, trim, engine, tile_size, workers, report_path, profile_stage, block_size, pipeline, output_profile),
+                                        {"contour_depths": contour_depths, "array_cache": array_cache, "output_tiles": output_tiles})
+
+
+#
+# Incremental update: recomputes only the changed areas of the depth model (previous_inpath -> inpath) in the
+# surface of the previous run (outpath, updated in place, see RollingCoin_Incremental).
+# contour_depths must be those of the previous run (see main).
+# Runs main instead if the raster, NoData or contour class depths have changed, or if the output has overviews (COG).
+#
+def update(previous_inpath, inpath, outpath, radius, trim, engine = "numpy", block_size = 256, contour_depths = None):
+    try:
+        previous_data = gdal.Open(previous_inpath, GA_ReadOnly)
+        previous_band = previous_data.GetRasterBand(1)
+        data = gdal.Open(inpath, GA_ReadOnly)   # Open dataset in read-only mode (GDAL)
+        band = data.GetRasterBand(1)            # Get elevation band
+        nodata = band.GetNoDataValue()          # Get NoData value
+
+        # Contour classes of both depth models (the shoalest class depends on the shoalest depth):
+        classes = None
+        classes_changed = False
+        if(contour_depths is not None):
+            classes = contour_classes(contour_depths, band.ComputeRasterMinMax(0)[1], nodata)
+            previous_classes = contour_classes(contour_depths, previous_band.ComputeRasterMinMax(0)[1], nodata)
+            classes_changed = not numpy.array_equal(classes[1], previous_classes[1])
+
+        outdata = gdal.Open(outpath, GA_ReadOnly)
+        overviews = RollingCoin_Output.has_overviews(outdata)
         outdata = None # Close dataset
+
+    except Exception:
+        print "Error loading the data. Exiting."
+        exit()
+
+    if(overviews == True):
+        print "\nOutput raster has overviews (COG), running full process.."
+        return main(inpath, outpath, radius, trim, engine, block_size = block_size, output_profile = "cog", contour_depths = contour_depths)
+
+    # Changes that affect every cell:
+    if(band.XSize != previous_band.XSize or band.YSize != previous_band.YSize or data.GetGeoTransform() != previous_data.GetGeoTransform()
+       or nodata != previous_band.GetNoDataValue() or classes_changed == True):
+        print "\nDepth model size, georeferencing, NoData or contour classes changed, running full process.."
+        return main(inpath, outpath, radius, trim, engine, block_size = block_size, contour_depths = contour_depths)
+
+    try:
+        coin = cached_coin(radius, trim)
+        print "\nCoin OK, radius = " + str(radius) + ", Trim =", trim
+    except Exception:
+        print "Error in coin creation. Exiting."
+        exit()
+
+    try:
+        print "\nComparing depth models.."
+        changed = RollingCoin_Incremental.changed_blocks(previous_band, band, block_size)
+        halo = RollingCoin_Tiles.tile_halo(radius - 1)
+        windows = RollingCoin_Incremental.update_windows(changed, block_size, halo, band.YSize, band.XSize)
+        print numpy.count_nonzero(changed), "of", changed.size, "blocks changed"
+
+        print "Buffering shoals and rolling coin in changed areas.."
+        outdata = gdal.Open(outpath, GA_Update)
+        function, args = surface_function(nodata, coin, radius - 1, engine, classes)
+        cells = RollingCoin_Incremental.update_band(band, outdata.GetRasterBand(1), windows, function, args)
+        outdata = None # Close dataset
+        print cells, "of", band.XSize * band.YSize, "cells recomputed"
         print "Done.\n"
-    
+
     except Exception:
-        print "Error exporting the surface. Exiting."
+        print "Error in surface manipulation. Exiting."
         exit()
 
 
@@ -267,10 +895,32 @@ def main(inpath, outpath, radius, trim):
 #   Start the process:  #
 #                       #
 
-trim = True     # Coin trim flag
-radius = 5      # Coin radius
-
-depth_model = R"C:\Users\user\Desktop\test.tif"
+trim = True         # Coin trim flag
+radius = 5          # Coin radius
+engine = "numpy"    # "numpy" (whole-array engine) or "loop" (reference cell-by-cell loops)
+tile_size = None    # None (whole raster in memory) or tile size in cells (e.g. 2048) for rasters larger than memory
+workers = None      # None (single process) or number of worker processes for tiles (0 = all CPU cores)
+pipeline = False    # True: tiles are read and written by background threads while tiles are processed
+output_profile = "default" # Output raster: "default" (striped GeoTIFF), "tiled", "deflate" / "zstd" (tiled, compressed) or "cog" (Cloud Optimized GeoTIFF with overviews)
+run_report = None   # None or path of JSON run report (stage times, memory, cell counts)
+profile_stage = None # None or stage to profile with cProfile: "read", "buffer_shoals", "roll_coin", "export" or "tiles"
+cache_directory = None # None or result cache directory (reprocessing an unchanged depth model copies the cached surface)
+cache_size = 1024   # Result cache size cap in MB
+radii = None        # None or list of coin radii (e.g. [3, 5, 8]) for one surface per radius from one run (output_path + "_r<radius>")
+contour_depths = None # None (32-bit float surface) or contour depths (e.g. [-3.09, -6.09, -10.09]) for rolling 8-bit contour classes
+
+depth_model = R"C:\Users\user\Desktop\test.tif" # GeoTIFF, or a mosaic: VRT file, list of files, directory or pattern (e.g. R"C:\Users\user\Desktop\Tiles\*.tif")
 output_path = R"C:\Users\user\Desktop\test_out.tif"
-
-main(depth_model, output_path, radius, trim)
+output_tiles = None # None (output_path) or directory of output tiles, one per source file of a mosaic depth model
+
+if __name__ == "__main__": # Worker processes import this script
+    if(radii is not None):
+        output_base, output_extension = os.path.splitext(output_path)
+        main_radii(depth_model, [output_base + "_r" + str(coin_radius) + output_extension for coin_radius in radii], radii, trim, engine, run_report, profile_stage,
+                   output_profile = output_profile)
+    elif(cache_directory is None):
+        main(depth_model, output_path, radius, trim, engine, tile_size, workers, run_report, profile_stage, pipeline = pipeline, output_profile = output_profile, output_tiles = output_tiles, contour_depths = contour_depths)
+    else:
+        cached_main(cache_directory, depth_model, output_path, radius, trim, engine, tile_size, workers, run_report, profile_stage,
+                    pipeline = pipeline, output_profile = output_profile, cache_size = cache_size,
+                    contour_depths = contour_depths, output_tiles = output_tiles)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Long-lived local worker for batch jobs: modules are loaded and coins created once for all jobs.
+# Jobs are JSON manifests that name the run function and its keyword arguments, e.g.:
+#
+#   {"script": "V1", "arguments": {"path": "D:/Data/Area1.tif", "outpath": "D:/Out/Area1_limits.tif",
+#                                  "contourpath": "D:/Out/Area1_contours.shp", "coin_radius": 10}}
+#   {"script": "V2", "arguments": {"inpath": "D:/Data/Area1.tif", "outpath": "D:/Out/Area1_surface.tif",
+#                                  "radius": 5, "trim": true, "output_profile": "deflate"}}
+#
+# Scripts: "V1" and "V2" (main), "V1_cached" and "V2_cached" (cached_main), "V2_radii" (main_radii) and
+# "V1_update" and "V2_update" (update).
+#
+# Jobs are taken from a job directory (shared by several workers):
+#   <directory>/incoming/<job>.json     New jobs (write to another name first and rename, so jobs are complete)
+#   <directory>/running/<job>.json      Jobs being processed
+#   <directory>/done/<job>.json         Finished jobs: the manifest with a "result" (status, wall time)
+#   <directory>/failed/<job>.json       Failed jobs: the manifest with a "result" (status, error)
+# or from a local TCP socket: one manifest per line, the result is returned as one JSON line.
+
+# Depends on:
+# 1. GDAL (see http://www.gdal.org/)
+# 2. NumPy (see http://www.numpy.org/)
+# 3. RollingCoin_V1.py and RollingCoin_V2.py
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+try:
+    import os
+    import glob
+    import json
+    import time
+    import socket
+    import traceback
+    import SocketServer
+    import RollingCoin_V1
+    import RollingCoin_V2
+
+except Exception:
+    print "Dependencies not installed? Make sure GDAL and NumPy are installed. Exiting."
+    exit()
+
+
+# Run functions of the job scripts:
+job_functions = {
+    "V1": RollingCoin_V1.main,
+    "V1_cached": RollingCoin_V1.cached_main,
+    "V1_update": RollingCoin_V1.update,
+    "V2": RollingCoin_V2.main,
+    "V2_cached": RollingCoin_V2.cached_main,
+    "V2_radii": RollingCoin_V2.main_radii,
+    "V2_update": RollingCoin_V2.update,
+}
+
+# Job directory states:
+job_states = ("incoming", "running", "done", "failed")
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Runs one job manifest (dictionary) in this process. Returns the result: {"status": "done" or "failed", "wall_time", "error"}.
+# An exit of the run function is a failed job.
+#
+def run_job(manifest):
+    if(not isinstance(manifest, dict)):
+        return {"status": "failed", "error": "Invalid job manifest: not a JSON object", "wall_time": 0.0}
+
+    start_time = time.time()
+    result = {"status": "done"}
+    try:
+        function = job_functions[manifest["script"]]
+        function(**manifest.get("arguments", {}))
+    except SystemExit:
+        result = {"status": "failed", "error": "Processing failed, see worker output."}
+    except Exception, e:
+        traceback.print_exc()
+        result = {"status": "failed", "error": repr(e)}
+
+    result["wall_time"] = time.time() - start_time
+    return result
+
+
+#
+# Creates the state subdirectories of a job directory.
+#
+def create_job_directory(directory):
+    for state in job_states:
+        path = os.path.join(directory, state)
+        if(os.path.isdir(path) == False):
+            os.makedirs(path)
+
+
+#
+# Claims the oldest incoming job by moving it to running. Returns the path of the running job, or None.
+#
+def claim_job(directory):
+    incoming = glob.glob(os.path.join(directory, "incoming", "*.json"))
+    for path in sorted(incoming, key = os.path.getmtime):
+        running = os.path.join(directory, "running", os.path.basename(path))
+        try:
+            os.rename(path, running)
+            return running
+        except OSError:
+            continue
+    return None
+
+
+#
+# Runs a claimed job and moves its manifest with the result to done or failed (also invalid manifests). Returns the result.
+#
+def process_job_file(directory, path):
+    manifest = None
+    try:
+        with open(path, "r") as job_file:
+            manifest = json.load(job_file)
+        result = run_job(manifest)
+    except (IOError, ValueError), e:
+        result = {"status": "failed", "error": "Invalid job manifest: " + str(e), "wall_time": 0.0}
+
+    if(not isinstance(manifest, dict)):
+        manifest = {"manifest": manifest}
+    manifest["result"] = result
+    finished = os.path.join(directory, result["status"], os.path.basename(path))
+    with open(finished, "w") as job_file:
+        json.dump(manifest, job_file, indent = 2)
+    try:
+        os.remove(path)
+    except OSError:
+        pass # Removed meanwhile
+    return result
+
+
+#
+# Processes the jobs of a job directory until stopped (Ctrl+C). With max_jobs set, returns after max_jobs or no jobs.
+#
+def watch_directory(directory, poll_interval = 1.0, max_jobs = None):
+    create_job_directory(directory)
+    print "Rolling Coin worker: waiting for jobs in", os.path.join(directory, "incoming")
+
+    jobs = 0
+    while(max_jobs is None or jobs < max_jobs):
+        path = claim_job(directory)
+        if(path is None):
+            if(max_jobs is not None):
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print "\nJob", os.path.basename(path)
+        result = process_job_file(directory, path)
+        print "Job", os.path.basename(path), result["status"] + ",", round(result["wall_time"], 2), "s"
+        jobs += 1
+    return jobs
+
+
+#
+# Socket request handler: reads one JSON manifest per line and writes one JSON result per line.
+#
+class JobHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        while(True):
+            line = self.rfile.readline()
+            if(line == ""):
+                break # Connection closed
+            if(line.strip() == ""):
+                continue
+            try:
+                result = run_job(json.loads(line))
+            except ValueError, e:
+                result = {"status": "failed", "error": "Invalid job manifest: " + str(e), "wall_time": 0.0}
+            self.wfile.write(json.dumps(result) + "\n")
+            self.wfile.flush()
+
+
+#
+# Processes jobs sent to a local TCP socket (127.0.0.1) one at a time until stopped (Ctrl+C).
+#
+def serve_socket(port, host = "127.0.0.1"):
+    server = SocketServer.TCPServer((host, port), JobHandler)
+    print "Rolling Coin worker: waiting for jobs on", host + ":" + str(port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+#
+# Sends one job manifest to a worker socket and returns the result.
+#
+def submit_job(manifest, port, host = "127.0.0.1"):
+    connection = socket.create_connection((host, port))
+    try:
+        connection.sendall(json.dumps(manifest) + "\n")
+        response = connection.makefile("r").readline()
+    finally:
+        connection.close()
+    return json.loads(response)
+
+
+
+# # # # # # # # # # # #
+# Start the process:  #
+# # # # # # # # # # # #
+
+job_directory = R"C:\Users\User\Path\Jobs" # Job directory (incoming, running, done and failed subdirectories)
+job_port = None # None (job directory) or local TCP port (e.g. 8765) to take jobs from a socket instead
+poll_interval = 1.0 # Seconds between checks for new jobs in the job directory
+
+if __name__ == "__main__": # Worker processes import this script
+    if(job_port is None):
+        watch_directory(job_directory, poll_interval)
+    else:
+        serve_socket(job_port)
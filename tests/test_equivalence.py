@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Python2
+
+# Part of FTA Depth contour production automation tests
+# Finnish Transport Agency, Hydrographic Office
+
+# Checks that the engines of RollingCoin_V1 and RollingCoin_V2 give the same output as the reference
+# cell-by-cell loops on a small synthetic depth model (no input rasters needed).
+#
+# Usage example:
+#   python -m pytest tests
+
+# Depends on:
+# 1. pytest (see https://pytest.org/)
+# 2. GDAL and NumPy (imported by RollingCoin_V1 and RollingCoin_V2, tests are skipped without GDAL)
+
+# # # # # # # # #
+#   Imports:    #
+# # # # # # # # #
+
+import os
+import sys
+import pytest
+
+pytest.importorskip("osgeo")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import RollingCoin_V1
+import RollingCoin_Benchmark
+
+
+# # # # # # # # # # # # # # #
+#   Test settings:          #
+# # # # # # # # # # # # # # #
+
+model_size = 120    # Rows and columns of the synthetic depth model
+model_seed = 0
+radii = [3, 6]
+references = {}     # Reference loop outputs by (version, stage, round coin, radius, trim)
+
+# (version, stage, engine, radius, trim) cases, V1 coin is always trimmed:
+cases = [(version, stage, engine, radius, trim)
+         for (version, stage), engines in sorted(RollingCoin_Benchmark.engines.items())
+         for engine in engines if engine != "loop"
+         for radius in radii
+         for trim in ([True, False] if version == "V2" else [True])]
+
+
+# # # # # # # # # # # # # # #
+#   Function definitions:   #
+# # # # # # # # # # # # # # #
+
+#
+# Returns the synthetic depth model (created once).
+#
+@pytest.fixture(scope = "module")
+def depth_array():
+    return RollingCoin_Benchmark.synthetic_depth_model(model_size, model_size, model_seed)
+
+
+#
+# Returns the output of an engine for one stage (main stage in memory).
+#
+def engine_result(version, stage, engine, depth_array, radius, trim):
+    if(stage == "main"):
+        return RollingCoin_Benchmark.main_result(version, engine, depth_array, radius, trim)
+    return RollingCoin_Benchmark.run_stage(version, stage, engine, depth_array, radius, trim, None)[1]
+
+
+#
+# Returns the output of the reference loops for one stage. "edt" is compared with the loops rolling its round coin.
+#
+def reference_result(version, stage, engine, depth_array, radius, trim):
+    key = (version, stage, engine == "edt", radius, trim)
+    if(key not in references):
+        references[key] = loop_result(version, stage, engine, depth_array, radius, trim)
+    return references[key]
+
+
+#
+# Runs the reference loops for one stage (see reference_result).
+#
+def loop_result(version, stage, engine, depth_array, radius, trim):
+    if(engine != "edt"):
+        return engine_result(version, stage, "loop", depth_array, radius, trim)
+
+    edt_coin = RollingCoin_V1.create_edt_coin(float(radius))
+    if(stage == "main"):
+        return RollingCoin_Benchmark.main_result(version, "loop", depth_array, radius, trim, edt_coin)
+
+    nodata = RollingCoin_Benchmark.nodata_value
+    valdco = RollingCoin_Benchmark.benchmark_valdco
+    byte_array = RollingCoin_V1.array_to_binaryarray(depth_array, RollingCoin_V1.parseDepthLimit(valdco), nodata, 15000)
+    buffered_array = RollingCoin_V1.buffer_shoals(byte_array, 15000)
+    result = numpy.zeros((depth_array.shape[0], depth_array.shape[1]), dtype = numpy.int16)
+    RollingCoin_V1.roll_coin(buffered_array, result, edt_coin, radius, 15000, valdco)
+    return result
+
+
+@pytest.mark.parametrize("version, stage, engine, radius, trim", cases)
+def test_engine_matches_reference(depth_array, version, stage, engine, radius, trim):
+    result = engine_result(version, stage, engine, depth_array, radius, trim)
+    assert result is not None
+    assert numpy.array_equal(result, reference_result(version, stage, engine, depth_array, radius, trim))